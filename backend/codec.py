@@ -0,0 +1,303 @@
+"""
+Content-negotiated reading codecs: JSON, MessagePack, CBOR and a packed struct.
+
+Packed frame (application/vnd.smartplants.reading), little-endian, 20 bytes:
+
+    float32 moisture | float32 temperature | float32 humidity | float32 light | uint32 millis
+
+light = NaN means "no light sensor". A batch is frames back to back; the
+device id comes from the X-Device-Id header. Responses use READING_OUT_FRAME
+(or BATCH_OUT_FRAME for /readings/batch).
+
+Packed, MessagePack and CBOR batches are decoded into column arrays and
+range-checked in one pass with the bounds declared on models.ReadingIn; JSON is
+validated by ReadingIn itself. A rejected binary batch is re-run through
+ReadingIn only to word the errors, so every format accepts exactly the same
+readings and reports them the same way.
+"""
+
+import calendar
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from models import ReadingIn, ReadingOut, ReadingBatchOut
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+PACKED = "application/vnd.smartplants.reading"
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+COLUMNS = ("moisture", "temperature", "humidity", "light")
+
+READING_FRAME = np.dtype([
+    ("moisture", "<f4"), ("temperature", "<f4"), ("humidity", "<f4"), ("light", "<f4"),
+    ("millis", "<u4"),
+])
+READING_OUT_FRAME = np.dtype([
+    ("id", "<u4"),
+    ("moisture", "<f4"), ("temperature", "<f4"), ("humidity", "<f4"), ("light", "<f4"),
+    ("created_at", "<u4"),  # unix seconds, UTC
+    ("water", "u1"),
+])
+BATCH_OUT_FRAME = np.dtype([("stored", "<u4"), ("water", "u1")])
+
+_readings_adapter = TypeAdapter(list[ReadingIn])
+
+
+def _bounds(field: str) -> tuple[Optional[float], Optional[float]]:
+    lo = hi = None
+    for constraint in ReadingIn.model_fields[field].metadata:
+        lo = getattr(constraint, "ge", lo)
+        hi = getattr(constraint, "le", hi)
+    return lo, hi
+
+
+BOUNDS = {name: _bounds(name) for name in COLUMNS}
+DEVICE_ID_MAX = next(c.max_length for c in ReadingIn.model_fields["device_id"].metadata if hasattr(c, "max_length"))
+FINITE = ReadingIn.model_config.get("allow_inf_nan") is False
+OPTIONAL = {name for name in COLUMNS if not ReadingIn.model_fields[name].is_required()}
+
+
+@dataclass
+class ReadingBatch:
+    moisture: np.ndarray
+    temperature: np.ndarray
+    humidity: np.ndarray
+    light: np.ndarray          # NaN where missing
+    device_id: list[str]
+
+    def __len__(self) -> int:
+        return len(self.moisture)
+
+    def rows(self) -> list[dict]:
+        light = self.light.astype(object)
+        light[np.isnan(self.light)] = None
+        return [
+            {"device_id": d, "moisture": m, "temperature": t, "humidity": h, "light": l}
+            for d, m, t, h, l in zip(
+                self.device_id, self.moisture.tolist(), self.temperature.tolist(),
+                self.humidity.tolist(), light.tolist(),
+            )
+        ]
+
+
+def media_type(header: Optional[str]) -> str:
+    value = (header or JSON).split(";", 1)[0].strip().lower()
+    return _ALIASES.get(value, value)
+
+
+def preferred(accept: Optional[str]) -> str:
+    """First binary type named in Accept, else JSON. Quality values are ignored."""
+    for part in (accept or "").split(","):
+        value = media_type(part)
+        if value in (MSGPACK, CBOR, PACKED):
+            return value
+    return JSON
+
+
+def _unsupported(kind: str) -> HTTPException:
+    return HTTPException(status_code=415, detail=f"{kind} support is not installed on this server")
+
+
+def _invalid(batch: ReadingBatch) -> dict[str, np.ndarray]:
+    """Per-column masks of rows that ReadingIn would reject."""
+    masks = {}
+    for name in COLUMNS:
+        values = getattr(batch, name)
+        lo, hi = BOUNDS[name]
+        bad = np.isnan(values) if name not in OPTIONAL else np.zeros(len(values), dtype=bool)
+        present = ~np.isnan(values)
+        if FINITE:
+            bad |= np.isinf(values)  # NaN stays the frame's "missing" marker
+        if lo is not None:
+            bad |= present & (values < lo)
+        if hi is not None:
+            bad |= present & (values > hi)
+        masks[name] = bad
+    return masks
+
+
+def valid_mask(batch: ReadingBatch) -> np.ndarray:
+    ok = np.ones(len(batch), dtype=bool)
+    for bad in _invalid(batch).values():
+        ok &= ~bad
+    return ok
+
+
+def from_frames(frames: np.ndarray, device_id: str) -> ReadingBatch:
+    return ReadingBatch(
+        *(frames[name].astype(np.float64) for name in COLUMNS),
+        device_id=[device_id] * len(frames),
+    )
+
+
+def _validate(batch: ReadingBatch) -> ReadingBatch:
+    errors = []
+    for name, bad in _invalid(batch).items():
+        values = getattr(batch, name)
+        lo, hi = BOUNDS[name]
+        present = ~np.isnan(values)
+        for i in np.flatnonzero(bad)[:20]:
+            errors.append({
+                "type": "value_error",
+                "loc": ("body", int(i), name),
+                "msg": (
+                    "Field required" if not present[i]
+                    else "Input should be a finite number" if np.isinf(values[i])
+                    else f"Value must be within [{lo}, {hi}]"
+                ),
+                "input": None if np.isnan(values[i]) else float(values[i]),
+            })
+    if errors:
+        raise RequestValidationError(errors)
+    return batch
+
+
+def _body_errors(e: ValidationError) -> RequestValidationError:
+    return RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
+
+
+def _from_models(readings: list[ReadingIn]) -> ReadingBatch:
+    return ReadingBatch(
+        *(np.array([getattr(r, name) for r in readings], dtype=np.float64) for name in COLUMNS),  # None -> NaN
+        device_id=[r.device_id for r in readings],
+    )
+
+
+def check_device_id(device_id: str, loc: tuple = ("header", "x-device-id")) -> str:
+    if len(device_id) > DEVICE_ID_MAX:
+        raise RequestValidationError([{
+            "type": "string_too_long",
+            "loc": loc,
+            "msg": f"String should have at most {DEVICE_ID_MAX} characters",
+            "input": device_id,
+        }])
+    return device_id
+
+
+def _model_errors(items: list) -> None:
+    """Raise ReadingIn's own errors for a batch the column checks rejected."""
+    try:
+        _readings_adapter.validate_python(items)
+    except ValidationError as e:
+        raise _body_errors(e)
+
+
+def _from_dicts(items: list, default_device: str) -> ReadingBatch:
+    items = [
+        {**item, "device_id": item.get("device_id") or default_device} if isinstance(item, dict) else item
+        for item in items
+    ]
+    try:
+        raw = {name: [item.get(name) for item in items] for name in COLUMNS}
+        batch = ReadingBatch(
+            *(np.array(raw[name], dtype=np.float64) for name in COLUMNS),  # None -> NaN
+            device_id=[item["device_id"] for item in items],
+        )
+    except (AttributeError, TypeError, ValueError):  # not an object, or a value that isn't a number
+        _model_errors(items)
+        raise HTTPException(status_code=400, detail="Readings must be objects of numbers")
+
+    if not (
+        valid_mask(batch).all()
+        and all(type(d) is str and len(d) <= DEVICE_ID_MAX for d in batch.device_id)  # checked, not truncated
+        and all(type(item.get("timestamp")) in (int, type(None)) for item in items)
+        and not any(_explicit_nan(raw[name], getattr(batch, name)) for name in OPTIONAL)
+    ):
+        _model_errors(items)
+        _validate(batch)
+    return batch
+
+
+def _explicit_nan(raw: list, values: np.ndarray) -> bool:
+    # NaN marks a missing optional value in the columns; a NaN that was actually sent is still non-finite
+    return FINITE and any(raw[i] is not None for i in np.flatnonzero(np.isnan(values)))
+
+
+def decode(content_type: Optional[str], body: bytes, default_device: str, batch: bool) -> ReadingBatch:
+    kind = media_type(content_type)
+
+    if kind == PACKED:
+        if len(body) == 0 or len(body) % READING_FRAME.itemsize or (not batch and len(body) != READING_FRAME.itemsize):
+            raise HTTPException(status_code=400, detail=f"Body must be {READING_FRAME.itemsize}-byte frames")
+        return _validate(from_frames(np.frombuffer(body, dtype=READING_FRAME), default_device))
+
+    if kind == JSON:
+        try:
+            if batch:
+                readings = _readings_adapter.validate_json(body)
+            else:
+                readings = [ReadingIn.model_validate_json(body)]
+        except ValidationError as e:
+            raise _body_errors(e)
+        return _from_models(readings)
+
+    if kind == MSGPACK:
+        if msgpack is None:
+            raise _unsupported("MessagePack")
+        try:
+            data = msgpack.unpackb(body)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Malformed MessagePack body")
+    elif kind == CBOR:
+        if cbor2 is None:
+            raise _unsupported("CBOR")
+        try:
+            data = cbor2.loads(body)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Malformed CBOR body")
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {kind}")
+
+    items = data if batch else [data]
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be an array")
+    return _from_dicts(items, default_device)
+
+
+def _encode_mapping(kind: str, body) -> Response:
+    if kind == MSGPACK:
+        if msgpack is None:
+            raise _unsupported("MessagePack")
+        return Response(msgpack.packb(body), media_type=MSGPACK)
+    if kind == CBOR:
+        if cbor2 is None:
+            raise _unsupported("CBOR")
+        return Response(cbor2.dumps(body), media_type=CBOR)
+    raise ValueError(kind)
+
+
+def encode_readings(kind: str, readings: list[ReadingOut], single: bool = False) -> Response:
+    if kind == PACKED:
+        frames = np.zeros(len(readings), dtype=READING_OUT_FRAME)
+        frames["id"] = [r.id for r in readings]
+        for name in ("moisture", "temperature", "humidity"):
+            frames[name] = [getattr(r, name) for r in readings]
+        frames["light"] = [np.nan if r.light is None else r.light for r in readings]
+        frames["created_at"] = [calendar.timegm(r.created_at.timetuple()) for r in readings]
+        frames["water"] = [r.water for r in readings]
+        return Response(frames.tobytes(), media_type=PACKED)
+    payload = [r.model_dump(mode="json") for r in readings]
+    return _encode_mapping(kind, payload[0] if single else payload)
+
+
+def encode_batch(kind: str, result: ReadingBatchOut) -> Response:
+    if kind == PACKED:
+        frame = np.array([(result.stored, result.water)], dtype=BATCH_OUT_FRAME)
+        return Response(frame.tobytes(), media_type=PACKED)
+    return _encode_mapping(kind, result.model_dump(mode="json"))
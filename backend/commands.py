@@ -0,0 +1,215 @@
+"""
+Per-device pump command queue.
+
+Every command is written to `pump_commands` and mirrored in an in-memory
+queue. Devices long-poll `GET /devices/{id}/commands`; a waiting poll is woken
+the moment a command is published. A command is redelivered on every poll
+until the device acks it by id, so a lost response can't drop a watering, and
+devices de-duplicate on command_id. Unacked commands are reloaded from the
+database on startup. Commands older than COMMAND_TTL_S are not delivered,
+so a device that reconnects after an outage does not water on stale orders;
+their rows are marked 'expired' so the table agrees with what devices see.
+An ack for an expired command (one the device already held) is recorded as
+'late_ack' rather than 'acked', so the missed TTL stays visible.
+
+The fast path assumes a single backend process, which is how the API is deployed.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from database import SessionLocal, PumpCommand, PumpEvent
+from models import DeviceCommandOut
+
+log = logging.getLogger(__name__)
+
+COMMAND_TTL = timedelta(seconds=float(os.getenv("COMMAND_TTL_S", "600")))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)  # matches naive-UTC created_at
+
+
+class CommandIdConflict(Exception):
+    """A client-supplied command_id is already used by a command for another device."""
+
+
+class CommandBus:
+    def __init__(self):
+        self._queues: dict[str, dict[str, DeviceCommandOut]] = {}
+        self._wakeups: dict[str, asyncio.Event] = {}
+        self._expiring: Optional[asyncio.Task] = None
+
+    def publish(self, device_id: str, command: DeviceCommandOut) -> None:
+        self._queues.setdefault(device_id, {})[command.command_id] = command
+        wakeup = self._wakeups.pop(device_id, None)
+        if wakeup is not None:
+            wakeup.set()
+
+    def pending(self, device_id: str) -> list[DeviceCommandOut]:
+        queue = self._queues.get(device_id)
+        if not queue:
+            return []
+        cutoff = _utcnow() - COMMAND_TTL
+        expired = [c.command_id for c in queue.values() if c.created_at < cutoff]
+        for command_id in expired:
+            del queue[command_id]
+            metrics.COMMANDS.inc("expired")
+        if expired and self._expiring is None:
+            # Persist off the poll path; one UPDATE covers every device's stale rows
+            self._expiring = asyncio.create_task(self._persist_expiry())
+        return list(queue.values())
+
+    async def _persist_expiry(self) -> None:
+        try:
+            await expire_stale()
+        except Exception:
+            log.exception("Marking expired pump commands failed")
+        finally:
+            self._expiring = None
+
+    async def wait(self, device_id: str, timeout: float) -> list[DeviceCommandOut]:
+        commands = self.pending(device_id)
+        if commands or timeout <= 0:
+            return commands
+        wakeup = self._wakeups.setdefault(device_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.pending(device_id)
+
+    def discard(self, device_id: str, command_id: str) -> None:
+        self._queues.get(device_id, {}).pop(command_id, None)
+
+
+bus = CommandBus()
+
+
+def _to_out(row: PumpCommand) -> DeviceCommandOut:
+    return DeviceCommandOut(
+        command_id=row.command_id,
+        duration_ms=row.duration_ms,
+        triggered_by=row.triggered_by,
+        created_at=row.created_at,
+    )
+
+
+async def create(db, event: PumpEvent, command_id: Optional[str] = None) -> PumpCommand:
+    """Add a command for a pump event to the session. Call publish() after commit."""
+    if event.id is None:
+        await db.flush()
+    row = PumpCommand(
+        command_id=command_id or uuid.uuid4().hex,
+        pump_event_id=event.id,
+        device_id=event.device_id,
+        duration_ms=event.duration_ms,
+        triggered_by=event.triggered_by,
+        created_at=_utcnow(),
+    )
+    db.add(row)
+    return row
+
+
+def publish(row: PumpCommand) -> None:
+    metrics.COMMANDS.inc("published")
+    bus.publish(row.device_id, _to_out(row))
+
+
+async def find(db, command_id: str) -> Optional[PumpCommand]:
+    result = await db.execute(select(PumpCommand).where(PumpCommand.command_id == command_id))
+    return result.scalar_one_or_none()
+
+
+async def _replay(db, event: PumpEvent, existing: PumpCommand) -> tuple[PumpEvent, PumpCommand]:
+    if existing.device_id != event.device_id:
+        raise CommandIdConflict(existing.command_id)
+    return await db.get(PumpEvent, existing.pump_event_id), existing
+
+
+async def create_event_with_command(
+    db, event: PumpEvent, command_id: Optional[str] = None,
+) -> tuple[PumpEvent, PumpCommand]:
+    """
+    Insert a pump event plus its command, idempotently when command_id is given.
+    Raises CommandIdConflict if command_id already belongs to another device.
+    """
+    if command_id is not None:
+        existing = await find(db, command_id)
+        if existing is not None:
+            return await _replay(db, event, existing)
+    db.add(event)
+    row = await create(db, event, command_id)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same command_id won the insert
+        await db.rollback()
+        existing = await find(db, command_id)
+        if existing is None:
+            raise
+        return await _replay(db, event, existing)
+    await db.refresh(event)
+    publish(row)
+    return event, row
+
+
+# Status an ack moves a command to, by the status it had
+_ACK_TRANSITIONS = {"pending": "acked", "expired": "late_ack"}
+
+
+async def ack(db, device_id: str, command_id: str) -> Optional[PumpCommand]:
+    """Mark a command acknowledged. Repeated acks are no-ops. Returns None if unknown."""
+    row = await find(db, command_id)
+    if row is None or row.device_id != device_id:
+        return None
+    bus.discard(device_id, command_id)
+    if row.status in _ACK_TRANSITIONS:
+        now = _utcnow()
+        # Conditional on the status, since the expiry task may mark the row between find() and here
+        for before, after in _ACK_TRANSITIONS.items():
+            result = await db.execute(
+                update(PumpCommand)
+                .where(PumpCommand.id == row.id, PumpCommand.status == before)
+                .values(status=after, acked_at=now)
+            )
+            if result.rowcount:
+                await db.commit()
+                metrics.COMMANDS.inc(after)
+                metrics.COMMAND_ACK_SECONDS.observe((now - row.created_at).total_seconds())
+                break
+        await db.refresh(row)
+    return row
+
+
+async def expire_stale() -> int:
+    """Mark pending commands older than COMMAND_TTL as expired. Returns the number of rows changed."""
+    async with SessionLocal() as db:
+        result = await db.execute(
+            update(PumpCommand)
+            .where(PumpCommand.status == "pending", PumpCommand.created_at < _utcnow() - COMMAND_TTL)
+            .values(status="expired")
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def load_pending() -> None:
+    """Refill the in-memory queues with unacked, unexpired commands after a restart."""
+    await expire_stale()  # expired while the backend was down
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(PumpCommand)
+            .where(PumpCommand.status == "pending", PumpCommand.created_at >= _utcnow() - COMMAND_TTL)
+            .order_by(PumpCommand.id)
+        )
+        for row in result.scalars().all():
+            bus.publish(row.device_id, _to_out(row))
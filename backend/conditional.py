@@ -0,0 +1,102 @@
+"""
+ETag / Last-Modified validation for the polled GET endpoints.
+
+A route's validator is built from the change counters of the tables it reads
+(database.table_versions), its query string and Accept header. A poll whose
+If-None-Match (or If-Modified-Since) still matches gets a 304 before the app
+runs, with no DB session, query or serialisation. The counters live in memory, so
+this assumes a single backend process, like the command bus. A per-boot
+nonce stops tags from a previous process from matching.
+
+HTTP dates have one-second resolution, so Last-Modified is the write time
+rounded up and is only sent once that second has passed. Otherwise a second
+write in the same second could hide behind a date the client already holds.
+"""
+
+import hashlib
+import math
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.datastructures import Headers
+
+import database
+import metrics
+
+BOOT = uuid.uuid4().hex[:8]
+BOOT_TIME = time.time()
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 requires for If-None-Match."""
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+def _not_modified_since(if_modified_since: str, modified: float) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return modified <= since  # full precision; never truncate the write time
+
+
+def _last_modified(modified: float, now: float) -> list[tuple[bytes, bytes]]:
+    """Last-Modified as the write time rounded up, once no later write can share that second."""
+    stamp = math.ceil(modified)
+    if stamp > now:
+        return []
+    return [(b"last-modified", formatdate(stamp, usegmt=True).encode())]
+
+
+class ConditionalGetMiddleware:
+    """Pure ASGI middleware; `routes` maps exact request paths to the tables they read."""
+
+    def __init__(self, app, routes: dict[str, tuple[str, ...]]):
+        self.app = app
+        self.routes = routes
+
+    def _etag(self, scope, headers: Headers, tables: tuple[str, ...]) -> str:
+        versions = ".".join(str(database.table_versions.get(t, 0)) for t in tables)
+        variant = hashlib.sha1(scope["query_string"] + b"|" + headers.get("accept", "").encode()).hexdigest()[:12]
+        return f'W/"{BOOT}-{versions}-{variant}"'
+
+    async def __call__(self, scope, receive, send):
+        tables = self.routes.get(scope["path"]) if scope["type"] == "http" else None
+        if tables is None or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        etag = self._etag(scope, headers, tables)
+        modified = max(database.table_changed_at.get(t, BOOT_TIME) for t in tables)
+        validators = [
+            (b"etag", etag.encode()),
+            *_last_modified(modified, time.time()),
+            (b"cache-control", b"no-cache"),
+            (b"vary", b"Accept"),
+        ]
+
+        # If-None-Match takes precedence; If-Modified-Since only counts without it
+        if "if-none-match" in headers:
+            fresh = _matches(headers["if-none-match"], etag)
+        else:
+            fresh = "if-modified-since" in headers and _not_modified_since(headers["if-modified-since"], modified)
+        if fresh:
+            metrics.CONDITIONAL_GETS.inc(scope["path"], "not_modified")
+            scope["route_path"] = scope["path"]  # never routed; let MetricsMiddleware label it anyway
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        metrics.CONDITIONAL_GETS.inc(scope["path"], "full")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message = {**message, "headers": [*message.get("headers", []), *validators]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
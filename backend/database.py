@@ -1,8 +1,10 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Float, Integer, String, DateTime, func
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+from sqlalchemy import Boolean, Float, ForeignKey, Integer, String, DateTime, Index, event, func, inspect
 from typing import Optional
 import os
+import time
+import metrics
 
 DB_PATH = os.getenv("DB_PATH", "../data/smart_plants.db")
 DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
@@ -11,45 +13,189 @@ engine = create_async_engine(DATABASE_URL, echo=False)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    metrics.DB_QUERY_SECONDS.observe(elapsed, statement.lstrip().split(None, 1)[0].upper())
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    session.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    start = session.info.pop("commit_start", None)
+    if start is not None:
+        metrics.DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+    now = time.time()
+    for table in session.info.pop("changed_tables", ()):
+        table_versions[table] = table_versions.get(table, 0) + 1
+        table_changed_at[table] = now
+
+
+# Per-table change counters behind conditional GETs (conditional.py). Bumped only
+# after commit, so a version never labels data a reader couldn't see yet.
+table_versions: dict[str, int] = {}
+table_changed_at: dict[str, float] = {}
+
+
+def _mark_changed(session, table: str) -> None:
+    session.info.setdefault("changed_tables", set()).add(table)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        _mark_changed(session, obj.__table__.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(state):
+    # insert()/update()/delete() statements bypass the unit of work, so flush never sees them
+    if state.is_insert or state.is_update or state.is_delete:
+        _mark_changed(state.session, state.statement.table.name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changed_tables", None)
+
+
 class Base(DeclarativeBase):
     pass
 
 
 class Reading(Base):
     __tablename__ = "readings"
+    __table_args__ = (
+        Index("ix_readings_device_created", "device_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False, server_default="default")
     moisture: Mapped[float] = mapped_column(Float, nullable=False)
     temperature: Mapped[float] = mapped_column(Float, nullable=False)
     humidity: Mapped[float] = mapped_column(Float, nullable=False)
     light: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
-    created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+    created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now(), index=True)
 
 
 class PumpEvent(Base):
     __tablename__ = "pump_events"
+    __table_args__ = (
+        # Covering indexes for the /pump/stats aggregates; the first also serves the by-period grouping
+        Index("ix_pump_events_created_trigger_duration", "created_at", "triggered_by", "duration_ms"),
+        Index("ix_pump_events_trigger_duration", "triggered_by", "duration_ms"),
+        Index("ix_pump_events_device_duration", "device_id", "duration_ms"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False, server_default="default")
     duration_ms: Mapped[int] = mapped_column(Integer, nullable=False)
     triggered_by: Mapped[str] = mapped_column(String(32), nullable=False)
     created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
 
 
+class PumpCommand(Base):
+    __tablename__ = "pump_commands"
+    __table_args__ = (
+        Index("ix_pump_commands_device_status", "device_id", "status", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    command_id: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    pump_event_id: Mapped[int] = mapped_column(Integer, ForeignKey("pump_events.id"), nullable=False)
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    duration_ms: Mapped[int] = mapped_column(Integer, nullable=False)
+    triggered_by: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default="pending")
+    created_at: Mapped[DateTime] = mapped_column(DateTime, nullable=False)
+    acked_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+
 class Prediction(Base):
     __tablename__ = "predictions"
+    __table_args__ = (
+        Index("ix_predictions_device", "device_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False, server_default="default")
     forecast_json: Mapped[str] = mapped_column(String, nullable=False)
     horizon_hours: Mapped[int] = mapped_column(Integer, nullable=False)
     predicted_dry_at_hours: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    bands_json: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # models.ForecastBands
+    created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+
+
+def _add_missing_columns(conn):
+    # Additive schema changes only: new columns must be nullable or have a server default
+    existing_tables = set(inspect(conn).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c["name"] for c in inspect(conn).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            default = column.server_default
+            if default is not None and isinstance(default.arg, str):
+                ddl += f" DEFAULT '{default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            conn.exec_driver_sql(ddl)
+
+
+def _create_missing_indexes(conn):
+    # create_all skips tables that already exist, so indexes added later
+    # to a model would never reach an existing database without this
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+class Anomaly(Base):
+    __tablename__ = "anomalies"
+    __table_args__ = (
+        Index("ix_anomalies_run_window", "run_id", "window_end"),
+        Index("ix_anomalies_run_score", "run_id", "score"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    run_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    window_end: Mapped[DateTime] = mapped_column(DateTime, nullable=False)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    threshold: Mapped[float] = mapped_column(Float, nullable=False)
+    is_anomaly: Mapped[bool] = mapped_column(Boolean, nullable=False)
     created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
 
 
 async def get_db() -> AsyncSession:
+    start = time.perf_counter()
     async with SessionLocal() as session:
-        yield session
+        try:
+            yield session
+        finally:
+            metrics.DB_SESSION_SECONDS.observe(time.perf_counter() - start)
@@ -0,0 +1,46 @@
+"""
+Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+
+Keeps the point in each bucket that forms the largest triangle with the
+previously kept point and the mean of the next bucket, so dips, spikes and
+threshold crossings survive even at a few hundred points.
+"""
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Return the indices of the n_out points to keep (first and last always kept)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+
+    # Bucket boundaries for the n - 2 interior points, n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Mean of every bucket up front — the "third point" for the bucket before it
+    csum_x = np.concatenate(([0.0], np.cumsum(x)))
+    csum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.maximum(ends - starts, 1)
+    avg_x = (csum_x[ends] - csum_x[starts]) / counts
+    avg_y = (csum_y[ends] - csum_y[starts]) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    # Each choice depends on the previous one, so buckets are walked in order;
+    # the triangle areas inside a bucket are computed in one vectorised step.
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        if hi <= lo:
+            hi = lo + 1
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x[i]) * (by - y[a]) - (x[a] - bx) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
@@ -0,0 +1,348 @@
+"""
+Event-driven forecast recomputation and model-based watering.
+
+Ingest calls `notify()` for every stored reading. A device is re-forecast only
+when enough new readings have arrived or moisture has moved more than a delta
+since its last forecast. Triggers are debounced so a burst of uploads runs one
+job, and a device never has more than one job queued. Idle plants cost nothing.
+
+Jobs that become ready within FORECAST_BATCH_S of each other share one model
+call. Each forecast also draws FORECAST_MC_SAMPLES Monte-Carlo dropout samples,
+giving p10/p50/p90 bands and P(dry) per hour. The K samples for all D devices in
+a call run as one (K × D) batch per step, so uncertainty costs a wider tensor
+rather than K extra rollouts.
+
+Each device is forecast with the model the registry serves it (see
+model_registry.py); a batch holding several models runs one call per model.
+The LSTM code and the registry come from ../scripts, and torch from
+requirements-forecast.txt. Without torch or SCRIPTS_DIR the scheduler stays
+disabled; without any model, jobs end early until one is promoted. Either way
+ingest is unaffected.
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select, desc, func
+
+import commands
+import metrics
+from database import SessionLocal, Reading, Prediction, PumpEvent
+from model_registry import ModelRegistry, SCRIPTS_DIR, MODEL_MANIFEST
+
+log = logging.getLogger(__name__)
+
+FORECAST_HORIZON = int(os.getenv("FORECAST_HORIZON", "6"))
+FORECAST_MIN_READINGS = int(os.getenv("FORECAST_MIN_READINGS", "12"))
+FORECAST_MOISTURE_DELTA = float(os.getenv("FORECAST_MOISTURE_DELTA", "5.0"))  # % points
+FORECAST_DEBOUNCE_S = float(os.getenv("FORECAST_DEBOUNCE_S", "30"))
+FORECAST_BATCH_S = float(os.getenv("FORECAST_BATCH_S", "0.5"))
+FORECAST_MC_SAMPLES = int(os.getenv("FORECAST_MC_SAMPLES", "50"))  # 0 = point forecasts only
+MC_MAX_ROWS = 2048  # samples × devices per batched forward pass
+DRY_THRESHOLD = 30.0  # %
+
+MODEL_WATER_LEAD_HOURS = float(os.getenv("MODEL_WATER_LEAD_HOURS", "2"))
+MODEL_PUMP_MS = int(os.getenv("MODEL_PUMP_MS", "3000"))
+MODEL_WATER_COOLDOWN = timedelta(minutes=float(os.getenv("MODEL_WATER_COOLDOWN_MIN", "120")))
+
+
+class Forecaster:
+    """The trained LSTM plus scaler, turning an hourly window in % / °C / lux into a forecast."""
+
+    def __init__(self, model_path: str, scaler_path: str):
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.insert(0, SCRIPTS_DIR)
+        import torch
+        from model import load_model, rollout, mc_dropout, mc_rollout, forecast_bands, dry_at_hours
+        from data_processing import FEATURES, TARGET, SEQ_LEN, normalize, denormalize_target
+
+        self._torch = torch
+        self._rollout = rollout
+        self._mc_rollout = mc_rollout
+        self._bands = forecast_bands
+        self._normalize = normalize
+        self._denormalize = denormalize_target
+        self.dry_at_hours = dry_at_hours
+        self.features = FEATURES
+        self.target_idx = FEATURES.index(TARGET)
+        self.seq_len = SEQ_LEN
+        self.model = load_model(model_path)
+        self.mc_model = mc_dropout(self.model)
+        with open(scaler_path, "rb") as f:
+            self.scaler = pickle.load(f)
+        # What the registry's LRU budgets for: parameters of the model and its MC dropout copy
+        self.nbytes = 2 * sum(t.numel() * t.element_size() for t in self.model.state_dict().values())
+
+    def predict_many(
+        self, windows: np.ndarray, horizon: int, samples: int = 0,
+    ) -> list[tuple[list[float], Optional[dict]]]:
+        """(devices, seq_len, features) windows → per device (point forecast, bands or None)."""
+        scaled = self._normalize(self.scaler, windows).astype(np.float32)
+        x = self._torch.from_numpy(scaled)
+        point = self._denormalize(self.scaler, self._rollout(self.model, x, horizon, self.target_idx).numpy())
+        if not samples:
+            return [([round(float(m), 2) for m in row], None) for row in point]
+
+        # Cap rows per forward pass: past a few thousand the LSTM gets slower per row, not faster
+        group = max(1, MC_MAX_ROWS // samples)
+        draws = np.concatenate([
+            self._mc_rollout(self.mc_model, x[i:i + group], horizon, samples, self.target_idx).numpy()
+            for i in range(0, len(x), group)
+        ], axis=1)
+        bands = self._bands(self._denormalize(self.scaler, draws), DRY_THRESHOLD)
+        return [
+            (
+                [round(float(m), 2) for m in point[d]],
+                {
+                    "samples": samples,
+                    **{k: np.round(v[d], 3 if k == "p_dry" else 2).tolist() for k, v in bands.items()},
+                },
+            )
+            for d in range(len(point))
+        ]
+
+
+def load_models() -> Optional[ModelRegistry]:
+    if importlib.util.find_spec("torch") is None:
+        log.warning("Forecast scheduler disabled: torch is not installed")
+        return None
+    try:
+        models = ModelRegistry(Forecaster, MODEL_MANIFEST)
+    except ImportError as e:
+        log.warning("Forecast scheduler disabled: model registry not importable from SCRIPTS_DIR=%s (%s)",
+                    SCRIPTS_DIR, e)
+        return None
+    if not models.available():
+        log.warning("No model yet: forecasts start once one is promoted in %s", MODEL_MANIFEST)
+    return models
+
+
+async def load_hourly_window(db, device_id: str, seq_len: int) -> Optional[np.ndarray]:
+    """
+    Hourly means for the device's last seq_len hours (gaps forward-filled), or
+    None if too sparse. Columns follow data_processing.FEATURES.
+    """
+    latest = (await db.execute(
+        select(func.max(Reading.created_at)).where(Reading.device_id == device_id)
+    )).scalar_one_or_none()
+    if latest is None:
+        return None
+    end = latest.replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=seq_len - 1)
+
+    hour = func.strftime("%Y-%m-%d %H:00:00", Reading.created_at).label("hour")
+    rows = (await db.execute(
+        select(
+            hour,
+            func.avg(Reading.moisture),
+            func.avg(Reading.temperature),
+            func.avg(Reading.humidity),
+            func.coalesce(func.avg(Reading.light), 0.0),
+        )
+        .where(Reading.device_id == device_id, Reading.created_at >= start)
+        .group_by("hour")
+    )).all()
+    # Require at least half the window to be real data before trusting the model
+    if len(rows) < seq_len // 2:
+        return None
+
+    by_hour = {datetime.fromisoformat(r[0]): r[1:] for r in rows}
+    window = np.full((seq_len, 4), np.nan)
+    for i in range(seq_len):
+        values = by_hour.get(start + timedelta(hours=i))
+        if values is not None:
+            window[i] = values
+        elif i > 0:
+            window[i] = window[i - 1]
+    # Leading gap: back-fill from the first real hour
+    first = int(np.argmax(~np.isnan(window[:, 0])))
+    window[:first] = window[first]
+    return window
+
+
+@dataclass
+class _DeviceState:
+    new_readings: int = 0
+    latest_moisture: float = 0.0
+    last_moisture: Optional[float] = None  # latest_moisture when the last job ran
+
+
+class _Batcher:
+    """Collects windows from jobs that are ready at about the same time into one predict_many call per model."""
+
+    def __init__(self):
+        self._waiting: list[tuple[Forecaster, np.ndarray, asyncio.Future]] = []
+        self._flush: Optional[asyncio.Task] = None
+
+    async def predict(self, forecaster: Forecaster, window: np.ndarray):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((forecaster, window, future))
+        if self._flush is None:
+            self._flush = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        await asyncio.sleep(FORECAST_BATCH_S)
+        batch, self._waiting, self._flush = self._waiting, [], None
+        by_model: dict[int, list] = {}
+        for item in batch:
+            by_model.setdefault(id(item[0]), []).append(item)
+        for group in by_model.values():
+            try:
+                results = await asyncio.to_thread(
+                    group[0][0].predict_many,
+                    np.stack([w for _, w, _ in group]), FORECAST_HORIZON, FORECAST_MC_SAMPLES,
+                )
+            except Exception as e:
+                results = [e] * len(group)
+            metrics.FORECAST_BATCH_SIZE.observe(len(group))
+            for (_, _, future), result in zip(group, results):
+                if future.done():  # the job was cancelled while waiting
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def shutdown(self) -> None:
+        if self._flush is not None:
+            self._flush.cancel()
+            await asyncio.gather(self._flush, return_exceptions=True)
+
+
+class ForecastScheduler:
+    def __init__(self, models: ModelRegistry):
+        self.models = models
+        self._batcher = _Batcher()
+        self._devices: dict[str, _DeviceState] = {}
+        self._pending: dict[str, asyncio.Task] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._tasks: set[asyncio.Task] = set()  # the loop only holds weak references
+
+    def notify(self, device_id: str, moisture: float) -> None:
+        state = self._devices.setdefault(device_id, _DeviceState())
+        state.new_readings += 1
+        state.latest_moisture = moisture
+        triggered = (
+            state.last_moisture is None
+            or state.new_readings >= FORECAST_MIN_READINGS
+            or abs(moisture - state.last_moisture) >= FORECAST_MOISTURE_DELTA
+        )
+        if not triggered:
+            return
+        if device_id in self._pending:
+            metrics.FORECAST_TRIGGERS.inc("coalesced")
+            return
+        metrics.FORECAST_TRIGGERS.inc("scheduled")
+        task = asyncio.create_task(self._run(device_id))
+        self._pending[device_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, device_id: str) -> None:
+        try:
+            # Debounce: let the rest of a burst land before reading the window
+            await asyncio.sleep(FORECAST_DEBOUNCE_S)
+        finally:
+            # From here on a new trigger queues a fresh job instead of coalescing
+            self._pending.pop(device_id, None)
+
+        lock = self._locks.setdefault(device_id, asyncio.Lock())
+        async with lock:
+            try:
+                await self._forecast(device_id)
+            except Exception:
+                metrics.FORECAST_TRIGGERS.inc("failed")
+                log.exception("Forecast for device %s failed", device_id)
+
+    async def _forecast(self, device_id: str) -> None:
+        start = time.perf_counter()
+        # Reset the trigger before reading, so readings that land mid-job count towards the next one
+        state = self._devices[device_id]
+        state.new_readings = 0
+        state.last_moisture = state.latest_moisture
+
+        forecaster = await self.models.get(device_id)
+        if forecaster is None:
+            metrics.FORECAST_TRIGGERS.inc("no_model")
+            return
+
+        async with SessionLocal() as db:
+            window = await load_hourly_window(db, device_id, forecaster.seq_len)
+            if window is None:
+                metrics.FORECAST_TRIGGERS.inc("insufficient_history")
+                return
+
+            forecast, bands = await self._batcher.predict(forecaster, window)
+            dry_at = forecaster.dry_at_hours(forecast, DRY_THRESHOLD)
+
+            db.add(Prediction(
+                device_id=device_id,
+                forecast_json=json.dumps(forecast),
+                horizon_hours=FORECAST_HORIZON,
+                predicted_dry_at_hours=dry_at,
+                bands_json=json.dumps(bands) if bands is not None else None,
+            ))
+            command = None
+            if dry_at is not None and dry_at <= MODEL_WATER_LEAD_HOURS:
+                command = await self._water(db, device_id)
+            await db.commit()
+        if command is not None:
+            commands.publish(command)
+        metrics.FORECAST_TRIGGERS.inc("completed")
+        metrics.FORECAST_SECONDS.observe(time.perf_counter() - start)
+
+    async def _water(self, db, device_id: str):
+        last = (await db.execute(
+            select(PumpEvent.created_at)
+            .where(PumpEvent.device_id == device_id, PumpEvent.triggered_by == "model")
+            .order_by(desc(PumpEvent.created_at)).limit(1)
+        )).scalar_one_or_none()
+        # Give the soil time to absorb the last dose before the model waters again
+        now = datetime.now(timezone.utc).replace(tzinfo=None)  # created_at is naive UTC
+        if last is not None and now - last < MODEL_WATER_COOLDOWN:
+            return None
+        event = PumpEvent(device_id=device_id, duration_ms=MODEL_PUMP_MS, triggered_by="model")
+        db.add(event)
+        return await commands.create(db, event)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._batcher.shutdown()
+        await self.models.shutdown()
+
+
+scheduler: Optional[ForecastScheduler] = None
+
+
+def start() -> None:
+    global scheduler
+    models = load_models()
+    if models is None:
+        scheduler = None
+        return
+    models.start()
+    scheduler = ForecastScheduler(models)
+
+
+async def stop() -> None:
+    if scheduler is not None:
+        await scheduler.shutdown()
+
+
+def notify(device_id: str, moisture: float) -> None:
+    if scheduler is not None:
+        scheduler.notify(device_id, moisture)
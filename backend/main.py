@@ -1,14 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
-from database import init_db
-from routes import readings, predictions, pump
+import asyncio
+import metrics
+import profiling
+import forecasting
+import commands
+import udp_ingest
+import timeseries
+import conditional
+from database import init_db, Reading, Prediction, PumpEvent
+from routes import readings, predictions, pump, anomalies, devices
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await commands.load_pending()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    forecasting.start()
+    await udp_ingest.start()
+    await timeseries.store.start()
     yield
+    await timeseries.store.stop()
+    await udp_ingest.stop()
+    await forecasting.stop()
+    lag_monitor.cancel()
 
 
 app = FastAPI(
@@ -18,18 +36,40 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Added innermost first: 304s still pass through CORS, and compression sees full bodies only
+app.add_middleware(conditional.ConditionalGetMiddleware, routes={
+    "/readings": (Reading.__tablename__,),
+    "/readings/plot": (Reading.__tablename__,),
+    "/readings/rollup": (Reading.__tablename__,),
+    "/predictions": (Prediction.__tablename__,),
+    "/predictions/latest": (Prediction.__tablename__,),
+    "/pump": (PumpEvent.__tablename__,),
+    "/pump/stats": (PumpEvent.__tablename__,),
+})
+# Large lists, plots and CSV exports; small bodies aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 app.include_router(readings.router)
 app.include_router(predictions.router)
 app.include_router(pump.router)
+app.include_router(anomalies.router)
+app.include_router(devices.router)
 
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
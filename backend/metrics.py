@@ -0,0 +1,231 @@
+"""
+Minimal Prometheus-style collectors for the backend hot paths.
+
+Every collector is updated from the event loop thread (HTTP handlers,
+SQLAlchemy events under aiosqlite's greenlet bridge, background tasks), so
+plain ints and floats are enough — there are no locks to contend on.
+"""
+
+import asyncio
+import os
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (32, 64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144)
+
+_REGISTRY: list = []
+
+
+def _fmt_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        _REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> list[str]:
+        return [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {v}"
+            for k, v in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self) -> list[str]:
+        lines = []
+        for labels, (counts, total, n) in self._series.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets + ("+Inf",), counts):
+                cumulative += c
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {n}")
+        return lines
+
+
+# ── Collectors ────────────────────────────────────────────────────────────────
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route"),
+)
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status"),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time spent executing a single SQL statement", ("op",),
+)
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_duration_seconds", "Time spent in session commit (flush + COMMIT)",
+)
+DB_SESSION_SECONDS = Histogram(
+    "db_session_duration_seconds", "Lifetime of a get_db session, including handler work",
+)
+READINGS_INGESTED = Counter(
+    "readings_ingested_total", "Sensor readings stored",
+)
+INGEST_PAYLOAD_BYTES = Histogram(
+    "ingest_payload_bytes", "Size of reading upload bodies", buckets=SIZE_BUCKETS,
+)
+WATER_DECISIONS = Counter(
+    "water_decisions_total", "Ingest responses by water decision", ("water",),
+)
+FORECAST_TRIGGERS = Counter(
+    "forecast_triggers_total", "Forecast triggers by outcome", ("outcome",),
+)
+FORECAST_SECONDS = Histogram(
+    "forecast_duration_seconds", "Wall time of one device forecast, excluding debounce",
+)
+CONDITIONAL_GETS = Counter(
+    "http_conditional_gets_total", "Validated GETs answered 304 vs. served in full", ("route", "outcome"),
+)
+FORECAST_BATCH_SIZE = Histogram(
+    "forecast_batch_devices", "Devices forecast together in one batched model call",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+MODEL_CACHE = Counter(
+    "model_cache_events_total", "Model registry cache lookups and removals", ("event",),
+)
+MODELS_LOADED = Gauge(
+    "model_cache_models", "Models currently loaded in the serving process",
+)
+MODEL_CACHE_BYTES = Gauge(
+    "model_cache_bytes", "Parameter bytes of the loaded models",
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "model_load_duration_seconds", "Time to load one checkpoint and scaler",
+)
+MODEL_SWAPS = Counter(
+    "model_manifest_swaps_total", "Manifest changes applied or failed, and promotions rejected for missing files", ("outcome",),
+)
+COMMANDS = Counter(
+    "pump_commands_total", "Pump commands by lifecycle step", ("step",),
+)
+COMMAND_ACK_SECONDS = Histogram(
+    "pump_command_ack_seconds", "Time from command creation to device acknowledgement",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+UDP_DATAGRAMS = Counter(
+    "udp_datagrams_total", "UDP ingest datagrams by outcome", ("outcome",),
+)
+UDP_SEQ_SKIPPED = Counter(
+    "udp_datagrams_skipped_total",
+    "Seqs jumped over by a newer datagram; minus udp_datagrams_total{outcome=\"reordered\"} estimates loss",
+)
+UDP_READINGS_INVALID = Counter(
+    "udp_readings_invalid_total", "UDP readings rejected by ReadingIn range checks",
+)
+UDP_READINGS_DROPPED = Counter(
+    "udp_readings_dropped_total", "UDP readings accepted but lost to a storage error or a full buffer",
+)
+PROCESS_RSS = Gauge(
+    "process_resident_memory_bytes", "Resident set size of the backend process",
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Scheduling delay of a periodic event loop tick",
+)
+
+
+def _rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return float(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        pass
+    try:
+        import resource  # not available on Windows
+    except ImportError:
+        return 0.0
+    # No procfs (macOS) — fall back to peak RSS, reported there in bytes
+    return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def render() -> str:
+    PROCESS_RSS.set(_rss_bytes())
+    out = []
+    for c in _REGISTRY:
+        out.append(f"# HELP {c.name} {c.help}")
+        out.append(f"# TYPE {c.name} {c.kind}")
+        out.extend(c.collect())
+    return "\n".join(out) + "\n"
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0.0))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware — records latency per route template, not per raw URL."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or scope.get("route_path", "unmatched")
+            REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], route)
+            REQUESTS.inc(scope["method"], route, str(status))
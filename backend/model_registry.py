@@ -0,0 +1,256 @@
+"""
+Serving side of the model registry (scripts/registry.py).
+
+A device is served by the promoted version of "device:<id>", of the plant type
+it is assigned to, or of "default". Loaded models sit in an LRU bounded by
+MODEL_CACHE_MB of parameters, so hundreds of registered models only cost the
+ones in recent use. Concurrent requests for a model that isn't loaded share
+one load.
+
+A watcher polls the manifest every MODEL_WATCH_S. On a change it first loads
+the newly promoted versions of models in the cache, then swaps in the new
+manifest with one assignment. Jobs resolve against one snapshot and keep the
+model they were handed, so a promotion never fails or stalls a forecast in
+flight. A key whose promoted version is missing keeps its previous one; if
+a warm load fails, the whole change is held back and the old manifest stays
+in service until the next poll retries it. Models the change supersedes don't
+count against the cache bound while their replacements load, so a promotion
+never pushes out a model that stays in service.
+
+Without a manifest (or for devices it doesn't cover) MODEL_PATH / SCALER_PATH
+serve every device, as before the registry existed. Those files are not
+watched, since train.py rewrites them mid-run.
+
+scripts/registry.py is only imported when a ModelRegistry is built, so the
+backend starts without SCRIPTS_DIR; forecasting then stays disabled.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+import metrics
+
+SCRIPTS_DIR = os.getenv("SCRIPTS_DIR", "../scripts")
+
+log = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv("MODEL_PATH", "../data/models/best_model.pt")
+SCALER_PATH = os.getenv("SCALER_PATH", "../data/processed/scaler.pkl")
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", "../data/models/manifest.json")
+MODEL_CACHE_MB = float(os.getenv("MODEL_CACHE_MB", "256"))
+MODEL_WATCH_S = float(os.getenv("MODEL_WATCH_S", "5"))
+
+DEFAULT_KEY = "default"  # registry.DEFAULT_KEY
+LEGACY = (DEFAULT_KEY, 0)  # registered versions start at 1
+
+
+def _log_failed_load(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Loading the default model failed", exc_info=task.exception())
+
+
+class ModelRegistry:
+    """`loader(checkpoint, scaler)` builds a model exposing `nbytes`; it runs in a worker thread."""
+
+    def __init__(self, loader: Callable, manifest_path: str = MODEL_MANIFEST):
+        # Raises ImportError without SCRIPTS_DIR; forecasting.load_models() then disables forecasts
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.insert(0, SCRIPTS_DIR)
+        import registry  # scripts/registry.py
+
+        self._registry = registry
+        self._loader = loader
+        self.manifest_path = Path(manifest_path)
+        self._stamp: Optional[tuple] = None
+        self.manifest: Optional[dict] = None
+        self._cache: OrderedDict[tuple[str, int], object] = OrderedDict()
+        self._bytes = 0
+        self._retiring: set[tuple[str, int]] = set()
+        stamp = self._stat()
+        if stamp:
+            try:
+                manifest = self._read()
+                self._validate(manifest)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                # A broken manifest must not stop the backend; the watcher retries it every poll
+                log.exception("Model manifest %s not loaded; serving %s", self.manifest_path, MODEL_PATH)
+            else:
+                self.manifest, self._stamp = manifest, stamp
+        self._loading: dict[tuple[str, int], asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = self.manifest_path.stat()
+        except FileNotFoundError:
+            return None
+        # os.replace gives a new inode, so a rewrite within one mtime tick still counts
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read(self) -> dict:
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _paths(self, entry: dict) -> tuple[str, str]:
+        base = self.manifest_path.parent
+        return str(base / entry["checkpoint"]), str(base / entry["scaler"])
+
+    def available(self) -> bool:
+        """Whether any device could be served right now."""
+        promoted = any(
+            entry.get("promoted") is not None for entry in (self.manifest or {}).get("models", {}).values()
+        )
+        return promoted or (os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH))
+
+    def _resolve(self, device_id: str) -> Optional[tuple[tuple[str, int], str, str]]:
+        found = self._registry.resolve(self.manifest, device_id) if self.manifest else None
+        if found is not None:
+            key, entry = found
+            return (key, entry["version"]), *self._paths(entry)
+        if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
+            return LEGACY, MODEL_PATH, SCALER_PATH
+        return None
+
+    async def get(self, device_id: str):
+        """The model serving this device, loading it on a miss; None if nothing covers it."""
+        target = self._resolve(device_id)
+        if target is None:
+            return None
+        key, checkpoint, scaler = target
+        model = self._cache.get(key)
+        if model is not None:
+            self._cache.move_to_end(key)
+            metrics.MODEL_CACHE.inc("hit")
+            return model
+        metrics.MODEL_CACHE.inc("miss")
+        return await self._load(key, checkpoint, scaler)
+
+    async def _load(self, key: tuple[str, int], checkpoint: str, scaler: str):
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.create_task(self._load_into_cache(key, checkpoint, scaler))
+        # Shielded: one waiter being cancelled must not abort the load the others wait on
+        return await asyncio.shield(task)
+
+    async def _load_into_cache(self, key: tuple[str, int], checkpoint: str, scaler: str):
+        start = time.perf_counter()
+        try:
+            model = await asyncio.to_thread(self._loader, checkpoint, scaler)
+        finally:
+            self._loading.pop(key, None)
+        metrics.MODEL_LOAD_SECONDS.observe(time.perf_counter() - start)
+        log.info("Loaded model %s v%s (%.1f MB)", key[0], key[1], model.nbytes / 2**20)
+        self._cache[key] = model
+        self._bytes += model.nbytes
+        self._evict()
+        self._report()
+        return model
+
+    def _evict(self) -> None:
+        # Evicted models are only dropped from the cache; a job still holding one finishes with it.
+        # Models a swap in progress supersedes leave with it, so they neither count nor get picked.
+        budget = MODEL_CACHE_MB * 2**20 + sum(self._cache[k].nbytes for k in self._retiring if k in self._cache)
+        candidates = [k for k in self._cache if k not in self._retiring]
+        for key in candidates[:-1]:  # always keep the most recent one
+            if self._bytes <= budget:
+                break
+            self._drop(key, "evicted")
+
+    def _drop(self, key: tuple[str, int], reason: str) -> None:
+        self._bytes -= self._cache.pop(key).nbytes
+        metrics.MODEL_CACHE.inc(reason)
+
+    def _report(self) -> None:
+        metrics.MODELS_LOADED.set(len(self._cache))
+        metrics.MODEL_CACHE_BYTES.set(self._bytes)
+
+    def _validate(self, manifest: dict) -> dict[str, tuple[int, str, str]]:
+        """Promoted (version, checkpoint, scaler) per key, after pinning keys whose promoted version is missing."""
+        current = (self.manifest or {}).get("models", {})
+        promoted = {}
+        for key, entry in manifest.get("models", {}).items():
+            version = entry.get("promoted")
+            if version is None:
+                continue
+            registered = entry.setdefault("versions", {}).get(str(version))
+            paths = self._paths(registered) if registered else None
+            if paths is None or not all(map(os.path.exists, paths)):
+                # A half-copied, deleted or unregistered version must not take down the key: keep what it served
+                old = current.get(key, {}).get("promoted")
+                log.error("%s v%s: %s; keeping v%s", key, version,
+                          "not registered" if paths is None else f"{paths[0]} or {paths[1]} not found", old)
+                metrics.MODEL_SWAPS.inc("rejected")
+                entry["promoted"] = old
+                if old is None:
+                    continue
+                entry["versions"].setdefault(str(old), current[key]["versions"][str(old)])
+                version = old
+                paths = self._paths(entry["versions"][str(old)])
+            checkpoint, scaler = paths
+            promoted[key] = version, checkpoint, scaler
+        return promoted
+
+    async def _swap(self, manifest: dict) -> None:
+        promoted = self._validate(manifest)
+        live = {(key, version) for key, (version, _, _) in promoted.items()}
+        if DEFAULT_KEY not in promoted:
+            live.add(LEGACY)  # devices nothing else covers still fall back to MODEL_PATH
+
+        # Warm the new versions of models in use, so no request waits on the load after the swap
+        in_use = {k for k, _ in self._cache}  # LEGACY counts as "default"
+        self._retiring = {k for k in self._cache if k not in live}
+        try:
+            for key, (version, checkpoint, scaler) in promoted.items():
+                if key in in_use and (key, version) not in self._cache:
+                    await self._load((key, version), checkpoint, scaler)
+        except BaseException:
+            self._retiring = set()
+            self._evict()  # they stay in service, so the bound applies to them again
+            self._report()
+            raise
+
+        self.manifest = manifest
+        for key in [k for k in self._cache if k not in live]:
+            self._drop(key, "superseded")
+        self._retiring = set()
+        self._evict()
+        self._report()
+        metrics.MODEL_SWAPS.inc("applied")
+        log.info("Model manifest revision %s in service", manifest.get("revision"))
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(MODEL_WATCH_S)
+            stamp = self._stat()
+            if stamp is None or stamp == self._stamp:
+                continue
+            try:
+                await self._swap(await asyncio.to_thread(self._read))
+            except Exception:
+                # Keep serving the previous manifest; the stamp stays old, so the next poll retries
+                metrics.MODEL_SWAPS.inc("failed")
+                log.exception("Model manifest change not applied")
+            else:
+                self._stamp = stamp
+
+    def start(self) -> None:
+        self._watcher = asyncio.create_task(self._watch())
+        # Warm the fallback model in the background, so the first forecasts don't wait for torch
+        target = self._resolve(DEFAULT_KEY)
+        if target is not None:
+            key, checkpoint, scaler = target
+            task = self._loading[key] = asyncio.create_task(self._load_into_cache(key, checkpoint, scaler))
+            task.add_done_callback(_log_failed_load)
+
+    async def shutdown(self) -> None:
+        tasks = [t for t in (self._watcher, *self._loading.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,9 +1,12 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 class ReadingIn(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)  # a NaN/inf sensor value is a fault, not a reading
+
+    device_id: str = Field("default", max_length=64)
     moisture: float = Field(..., ge=0, le=100, description="Soil moisture %")
     temperature: float = Field(..., description="Temperature °C")
     humidity: float = Field(..., ge=0, le=100, description="Relative humidity %")
@@ -13,6 +16,7 @@ class ReadingIn(BaseModel):
 
 class ReadingOut(BaseModel):
     id: int
+    device_id: str
     moisture: float
     temperature: float
     humidity: float
@@ -21,20 +25,128 @@ class ReadingOut(BaseModel):
     water: bool = False
 
 
+class ReadingBatchOut(BaseModel):
+    stored: int
+    water: bool = False  # decision for the most recent reading in the batch
+
+
+class PlotSeries(BaseModel):
+    timestamps: list[datetime]
+    values: list[float]
+
+
+class PlotOut(BaseModel):
+    since: Optional[datetime]
+    until: Optional[datetime]
+    total_points: int
+    metrics: dict[str, PlotSeries]
+
+
+class RollupSeries(BaseModel):
+    mean: list[Optional[float]]
+    min: list[Optional[float]]
+    max: list[Optional[float]]
+
+
+class RollupOut(BaseModel):
+    bucket_seconds: int
+    buckets: list[datetime]
+    count: list[int]
+    metrics: dict[str, RollupSeries]
+
+
+class ForecastBands(BaseModel):
+    """Monte-Carlo dropout spread, one value per forecast hour."""
+    samples: int
+    p10: list[float]
+    p50: list[float]
+    p90: list[float]
+    p_dry: list[float] = Field(description="Probability moisture has dropped below the dry threshold by each hour")
+
+
+class PredictionIn(BaseModel):
+    device_id: str = Field("default", max_length=64)
+    forecast: list[float]
+    horizon_hours: int = Field(ge=1)
+    predicted_dry_at_hours: Optional[float] = None
+    bands: Optional[ForecastBands] = None
+
+
 class PredictionOut(BaseModel):
+    device_id: str = "default"
     forecast: list[float]
     horizon_hours: int
     dry_threshold: float
     predicted_dry_at_hours: Optional[float]
+    bands: Optional[ForecastBands] = None
+
+
+class AnomalyOut(BaseModel):
+    window_end: datetime
+    score: float
+    is_anomaly: bool
+
+
+class AnomalySummary(BaseModel):
+    run_id: Optional[str]
+    threshold: Optional[float]
+    total_windows: int
+    anomalies: int
+    max_score: Optional[float]
+    first_window: Optional[datetime]
+    last_window: Optional[datetime]
 
 
 class PumpCommandIn(BaseModel):
+    device_id: str = Field("default", max_length=64)
     duration_ms: int = Field(3000, ge=500, le=30000)
     triggered_by: str = Field("manual", description="'manual' | 'model' | 'emergency'")
+    command_id: Optional[str] = Field(
+        None, max_length=64, description="Client idempotency key — retries with the same id water once",
+    )
 
 
 class PumpEventOut(BaseModel):
     id: int
+    device_id: str
     duration_ms: int
     triggered_by: str
     created_at: datetime
+    command_id: Optional[str] = None
+
+
+class DeviceCommandOut(BaseModel):
+    command_id: str
+    duration_ms: int
+    triggered_by: str
+    created_at: datetime
+
+
+class TriggerStats(BaseModel):
+    triggered_by: str
+    events: int
+    total_duration_ms: int
+
+
+class PeriodStats(BaseModel):
+    period_start: date
+    triggered_by: str
+    events: int
+    total_duration_ms: int
+
+
+class DeviceStats(BaseModel):
+    device_id: str
+    events: int
+    total_duration_ms: int
+    water_ml: float
+
+
+class PumpStatsOut(BaseModel):
+    total_events: int
+    total_duration_ms: int
+    last_watered_at: Optional[datetime]
+    flow_ml_per_s: float
+    by_trigger: list[TriggerStats]
+    by_period: list[PeriodStats]
+    by_device: list[DeviceStats]
@@ -0,0 +1,53 @@
+"""
+On-demand request profiling.
+
+With PROFILING_ENABLED=1, a request carrying `X-Profile: 1` (or `?profile=1`)
+is run under pyinstrument's sampling profiler and the profile report is
+returned instead of the normal response. Use `text` instead of `1` for a
+plain-text call tree. Without the env var the middleware is not installed.
+"""
+
+import os
+from urllib.parse import parse_qs
+from starlette.responses import HTMLResponse, PlainTextResponse
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.0005"))  # seconds between samples
+
+
+def _requested_format(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode() or None
+    query = parse_qs(scope.get("query_string", b"").decode())
+    values = query.get("profile")
+    return values[0] if values else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        fmt = _requested_format(scope) if scope["type"] == "http" else None
+        if fmt in (None, "0", "false"):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+
+        async def discard(message):
+            pass
+
+        profiler = Profiler(interval=PROFILING_INTERVAL, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+
+        if fmt == "text":
+            response = PlainTextResponse(profiler.output_text(unicode=True, show_all=False))
+        else:
+            response = HTMLResponse(profiler.output_html())
+        await response(scope, receive, send)
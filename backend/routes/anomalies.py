@@ -0,0 +1,110 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, cast, select, desc, func
+from database import get_db, Anomaly as AnomalyRow
+from models import AnomalyOut, AnomalySummary
+from datetime import datetime
+from typing import Optional
+
+router = APIRouter(prefix="/anomalies", tags=["anomalies"])
+
+
+async def _latest_run_id(db: AsyncSession) -> Optional[str]:
+    result = await db.execute(
+        select(AnomalyRow.run_id).order_by(desc(AnomalyRow.id)).limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+def _in_range(query, run_id: str, since: Optional[datetime], until: Optional[datetime]):
+    query = query.where(AnomalyRow.run_id == run_id)
+    if since is not None:
+        query = query.where(AnomalyRow.window_end >= since)
+    if until is not None:
+        query = query.where(AnomalyRow.window_end <= until)
+    return query
+
+
+@router.get("", response_model=list[AnomalyOut])
+async def get_anomalies(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    flagged_only: bool = False,
+    limit: int = Query(1000, ge=1, le=10000),
+    offset: int = Query(0, ge=0),
+    run_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    run_id = run_id or await _latest_run_id(db)
+    if run_id is None:
+        return []
+
+    query = _in_range(select(AnomalyRow), run_id, since, until)
+    if flagged_only:
+        query = query.where(AnomalyRow.is_anomaly.is_(True))
+    result = await db.execute(
+        query.order_by(AnomalyRow.window_end).offset(offset).limit(limit)
+    )
+    return [
+        AnomalyOut(window_end=r.window_end, score=r.score, is_anomaly=r.is_anomaly)
+        for r in result.scalars().all()
+    ]
+
+
+@router.get("/top", response_model=list[AnomalyOut])
+async def get_top_anomalies(
+    k: int = Query(20, ge=1, le=1000),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    run_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    run_id = run_id or await _latest_run_id(db)
+    if run_id is None:
+        return []
+
+    query = _in_range(select(AnomalyRow), run_id, since, until)
+    result = await db.execute(
+        query.where(AnomalyRow.is_anomaly.is_(True)).order_by(desc(AnomalyRow.score)).limit(k)
+    )
+    return [
+        AnomalyOut(window_end=r.window_end, score=r.score, is_anomaly=r.is_anomaly)
+        for r in result.scalars().all()
+    ]
+
+
+@router.get("/summary", response_model=AnomalySummary)
+async def get_anomaly_summary(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    run_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    run_id = run_id or await _latest_run_id(db)
+    if run_id is None:
+        return AnomalySummary(
+            run_id=None, threshold=None, total_windows=0, anomalies=0,
+            max_score=None, first_window=None, last_window=None,
+        )
+
+    query = _in_range(
+        select(
+            func.count(),
+            func.sum(cast(AnomalyRow.is_anomaly, Integer)),
+            func.max(AnomalyRow.score),
+            func.max(AnomalyRow.threshold),
+            func.min(AnomalyRow.window_end),
+            func.max(AnomalyRow.window_end),
+        ),
+        run_id, since, until,
+    )
+    total, flagged, max_score, threshold, first, last = (await db.execute(query)).one()
+    return AnomalySummary(
+        run_id=run_id,
+        threshold=threshold,
+        total_windows=total,
+        anomalies=int(flagged or 0),
+        max_score=max_score,
+        first_window=first,
+        last_window=last,
+    )
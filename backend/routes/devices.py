@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from models import DeviceCommandOut
+import commands
+
+router = APIRouter(prefix="/devices", tags=["devices"])
+
+
+@router.get("/{device_id}/commands", response_model=list[DeviceCommandOut])
+async def poll_commands(device_id: str, wait: float = Query(25.0, ge=0, le=60)):
+    """
+    Long-poll for pump commands. Returns as soon as one is queued, or an empty
+    list after `wait` seconds. Unacked commands are returned again on the next poll.
+    """
+    return await commands.bus.wait(device_id, wait)
+
+
+@router.post("/{device_id}/commands/{command_id}/ack")
+async def ack_command(device_id: str, command_id: str, db: AsyncSession = Depends(get_db)):
+    row = await commands.ack(db, device_id, command_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Unknown command")
+    return {"command_id": command_id, "status": row.status}
@@ -2,41 +2,60 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from database import get_db, Prediction as PredictionRow
-from models import PredictionOut
+from models import PredictionIn, PredictionOut, ForecastBands
+from typing import Optional
 import json
 
 router = APIRouter(prefix="/predictions", tags=["predictions"])
 
+DRY_THRESHOLD = 30.0  # %
 
-@router.get("/latest", response_model=PredictionOut)
-async def get_latest_prediction(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(PredictionRow).order_by(desc(PredictionRow.created_at)).limit(1)
-    )
-    row = result.scalar_one_or_none()
-    if row is None:
-        raise HTTPException(status_code=404, detail="No predictions available yet")
 
+def _to_out(row: PredictionRow) -> PredictionOut:
     return PredictionOut(
+        device_id=row.device_id,
         forecast=json.loads(row.forecast_json),
         horizon_hours=row.horizon_hours,
-        dry_threshold=30.0,
+        dry_threshold=DRY_THRESHOLD,
         predicted_dry_at_hours=row.predicted_dry_at_hours,
+        bands=ForecastBands.model_validate_json(row.bands_json) if row.bands_json else None,
     )
 
 
-@router.get("", response_model=list[PredictionOut])
-async def get_predictions(limit: int = 20, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(PredictionRow).order_by(desc(PredictionRow.created_at)).limit(limit)
+@router.post("", response_model=PredictionOut)
+async def create_prediction(body: PredictionIn, db: AsyncSession = Depends(get_db)):
+    """Store a forecast computed outside the API, e.g. by `scripts/predict.py --post`."""
+    if len(body.forecast) != body.horizon_hours:
+        raise HTTPException(status_code=422, detail="forecast must have horizon_hours values")
+    row = PredictionRow(
+        device_id=body.device_id,
+        forecast_json=json.dumps(body.forecast),
+        horizon_hours=body.horizon_hours,
+        predicted_dry_at_hours=body.predicted_dry_at_hours,
+        bands_json=body.bands.model_dump_json() if body.bands else None,
     )
-    rows = result.scalars().all()
-    return [
-        PredictionOut(
-            forecast=json.loads(r.forecast_json),
-            horizon_hours=r.horizon_hours,
-            dry_threshold=30.0,
-            predicted_dry_at_hours=r.predicted_dry_at_hours,
-        )
-        for r in rows
-    ]
+    db.add(row)
+    await db.commit()
+    await db.refresh(row)
+    return _to_out(row)
+
+
+@router.get("/latest", response_model=PredictionOut)
+async def get_latest_prediction(device_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    query = select(PredictionRow).order_by(desc(PredictionRow.id)).limit(1)
+    if device_id is not None:
+        query = query.where(PredictionRow.device_id == device_id)
+    result = await db.execute(query)
+    row = result.scalar_one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="No predictions available yet")
+    return _to_out(row)
+
+
+@router.get("", response_model=list[PredictionOut])
+async def get_predictions(limit: int = 20, device_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    query = select(PredictionRow).order_by(desc(PredictionRow.id)).limit(limit)
+    if device_id is not None:
+        query = query.where(PredictionRow.device_id == device_id)
+    result = await db.execute(query)
+    return [_to_out(r) for r in result.scalars().all()]
@@ -1,27 +1,41 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, func
 from database import get_db, PumpEvent as PumpEventRow
-from models import PumpCommandIn, PumpEventOut
+from models import PumpCommandIn, PumpEventOut, PumpStatsOut, TriggerStats, PeriodStats, DeviceStats
+from datetime import date, datetime
+from typing import Literal, Optional
+import os
+import commands
 
 router = APIRouter(prefix="/pump", tags=["pump"])
 
+PUMP_FLOW_ML_PER_S = float(os.getenv("PUMP_FLOW_ML_PER_S", "25"))  # ml/s — depends on pump and head height
+
 
 @router.post("", response_model=PumpEventOut)
 async def log_pump_event(payload: PumpCommandIn, db: AsyncSession = Depends(get_db)):
-    row = PumpEventRow(
-        duration_ms=payload.duration_ms,
-        triggered_by=payload.triggered_by,
-    )
-    db.add(row)
-    await db.commit()
-    await db.refresh(row)
+    """Log a pump event and queue it as a command for the device's long-poll."""
+    try:
+        row, command = await commands.create_event_with_command(
+            db,
+            PumpEventRow(
+                device_id=payload.device_id,
+                duration_ms=payload.duration_ms,
+                triggered_by=payload.triggered_by,
+            ),
+            payload.command_id,
+        )
+    except commands.CommandIdConflict:
+        raise HTTPException(status_code=409, detail="command_id is already used by another device")
 
     return PumpEventOut(
         id=row.id,
+        device_id=row.device_id,
         duration_ms=row.duration_ms,
         triggered_by=row.triggered_by,
         created_at=row.created_at,
+        command_id=command.command_id,
     )
 
 
@@ -34,9 +48,64 @@ async def get_pump_events(limit: int = 50, db: AsyncSession = Depends(get_db)):
     return [
         PumpEventOut(
             id=r.id,
+            device_id=r.device_id,
             duration_ms=r.duration_ms,
             triggered_by=r.triggered_by,
             created_at=r.created_at,
         )
         for r in rows
     ]
+
+
+@router.get("/stats", response_model=PumpStatsOut)
+async def get_pump_stats(
+    bucket: Literal["day", "week"] = "day",
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """All-time (or since `since`) watering aggregates, computed in SQL."""
+    where = [PumpEventRow.created_at >= since] if since is not None else []
+    total_ms = func.coalesce(func.sum(PumpEventRow.duration_ms), 0)
+
+    events, duration, last = (await db.execute(
+        select(func.count(), total_ms, func.max(PumpEventRow.created_at)).where(*where)
+    )).one()
+
+    by_trigger = (await db.execute(
+        select(PumpEventRow.triggered_by, func.count(), total_ms)
+        .where(*where).group_by(PumpEventRow.triggered_by)
+    )).all()
+
+    if bucket == "week":
+        # SQLite: roll back to the Monday starting the week
+        period = func.date(PumpEventRow.created_at, "weekday 0", "-6 days")
+    else:
+        period = func.date(PumpEventRow.created_at)
+    by_period = (await db.execute(
+        select(period.label("period"), PumpEventRow.triggered_by, func.count(), total_ms)
+        .where(*where).group_by("period", PumpEventRow.triggered_by).order_by("period")
+    )).all()
+
+    by_device = (await db.execute(
+        select(PumpEventRow.device_id, func.count(), total_ms)
+        .where(*where).group_by(PumpEventRow.device_id)
+    )).all()
+
+    return PumpStatsOut(
+        total_events=events,
+        total_duration_ms=duration,
+        last_watered_at=last,
+        flow_ml_per_s=PUMP_FLOW_ML_PER_S,
+        by_trigger=[
+            TriggerStats(triggered_by=t, events=n, total_duration_ms=ms) for t, n, ms in by_trigger
+        ],
+        by_period=[
+            PeriodStats(period_start=date.fromisoformat(p), triggered_by=t, events=n, total_duration_ms=ms)
+            for p, t, n, ms in by_period
+        ],
+        by_device=[
+            DeviceStats(device_id=d, events=n, total_duration_ms=ms,
+                        water_ml=round(ms / 1000 * PUMP_FLOW_ML_PER_S, 1))
+            for d, n, ms in by_device
+        ],
+    )
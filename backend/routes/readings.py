@@ -1,30 +1,78 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import insert, select, desc
 from database import get_db, Reading as ReadingRow
-from models import ReadingIn, ReadingOut
+from models import ReadingIn, ReadingOut, ReadingBatchOut, PlotOut, PlotSeries, RollupOut, RollupSeries
+from downsample import lttb
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import metrics
+import forecasting
+import codec
+import timeseries
 
 router = APIRouter(prefix="/readings", tags=["readings"])
 
 DRY_THRESHOLD = 30.0  # % — water immediately if below this
+PLOT_METRICS = timeseries.METRICS
+ROLLUP_BUCKETS = {"5m": 300, "15m": 900, "1h": 3600, "6h": 21600, "1d": 86400}
 
 
-@router.post("", response_model=ReadingOut)
-async def ingest_reading(payload: ReadingIn, db: AsyncSession = Depends(get_db)):
-    row = ReadingRow(
-        moisture=payload.moisture,
-        temperature=payload.temperature,
-        humidity=payload.humidity,
-        light=payload.light,
-    )
+def _body_doc(schema: dict) -> dict:
+    # The body is decoded by hand for content negotiation, so describe it for OpenAPI here
+    binary = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": {
+        codec.JSON: {"schema": schema},
+        codec.MSGPACK: binary,
+        codec.CBOR: binary,
+        codec.PACKED: binary,
+    }}}
+
+
+def _decode(request: Request, body: bytes, batch: bool) -> codec.ReadingBatch:
+    device_id = codec.check_device_id(request.headers.get("x-device-id", "default"))
+    return codec.decode(request.headers.get("content-type"), body, device_id, batch=batch)
+
+
+def _after_store(batch: codec.ReadingBatch) -> None:
+    metrics.READINGS_INGESTED.inc(amount=len(batch))
+    for device_id, moisture in zip(batch.device_id, batch.moisture.tolist()):
+        forecasting.notify(device_id, moisture)
+
+
+async def store_batch(db: AsyncSession, batch: codec.ReadingBatch) -> None:
+    """Insert validated readings with one executemany. Shared by HTTP batch and UDP ingest."""
+    if not len(batch):
+        return
+    await db.execute(insert(ReadingRow), batch.rows())
+    await db.commit()
+    _after_store(batch)
+
+
+def _record_request(nbytes: int, water: bool) -> None:
+    metrics.INGEST_PAYLOAD_BYTES.observe(nbytes)
+    metrics.WATER_DECISIONS.inc(str(water).lower())
+
+
+@router.post("", response_model=ReadingOut, openapi_extra=_body_doc(ReadingIn.model_json_schema()))
+async def ingest_reading(request: Request, db: AsyncSession = Depends(get_db)):
+    """Store one reading. Accepts JSON, MessagePack, CBOR or a packed frame; replies in the Accept type."""
+    body = await request.body()
+    batch = _decode(request, body, batch=False)
+    row = ReadingRow(**batch.rows()[0])
     db.add(row)
     await db.commit()
     await db.refresh(row)
 
-    should_water = payload.moisture < DRY_THRESHOLD
+    should_water = row.moisture < DRY_THRESHOLD
+    _after_store(batch)
+    _record_request(len(body), should_water)
 
-    return ReadingOut(
+    out = ReadingOut(
         id=row.id,
+        device_id=row.device_id,
         moisture=row.moisture,
         temperature=row.temperature,
         humidity=row.humidity,
@@ -32,17 +80,49 @@ async def ingest_reading(payload: ReadingIn, db: AsyncSession = Depends(get_db))
         created_at=row.created_at,
         water=should_water,
     )
+    kind = codec.preferred(request.headers.get("accept"))
+    return out if kind == codec.JSON else codec.encode_readings(kind, [out], single=True)
+
+
+@router.post(
+    "/batch", response_model=ReadingBatchOut,
+    openapi_extra=_body_doc({"type": "array", "items": ReadingIn.model_json_schema()}),
+)
+async def ingest_readings_batch(request: Request, db: AsyncSession = Depends(get_db)):
+    """Store many readings in one executemany; `water` reflects the last reading in the batch."""
+    body = await request.body()
+    batch = _decode(request, body, batch=True)
+    await store_batch(db, batch)
+
+    should_water = bool(len(batch) and batch.moisture[-1] < DRY_THRESHOLD)
+    _record_request(len(body), should_water)
+
+    out = ReadingBatchOut(stored=len(batch), water=should_water)
+    kind = codec.preferred(request.headers.get("accept"))
+    return out if kind == codec.JSON else codec.encode_batch(kind, out)
 
 
 @router.get("", response_model=list[ReadingOut])
-async def get_readings(limit: int = 100, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(ReadingRow).order_by(desc(ReadingRow.created_at)).limit(limit)
-    )
+async def get_readings(
+    request: Request,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    device_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    # after_id lets pollers fetch only what they haven't seen; ids are monotonic,
+    # unlike created_at which SQLite stores with one-second resolution
+    query = select(ReadingRow).order_by(desc(ReadingRow.id)).limit(limit)
+    if after_id is not None:
+        query = query.where(ReadingRow.id > after_id)
+    if device_id is not None:
+        query = query.where(ReadingRow.device_id == device_id)
+    result = await db.execute(query)
     rows = result.scalars().all()
-    return [
+    out = [
         ReadingOut(
             id=r.id,
+            device_id=r.device_id,
             moisture=r.moisture,
             temperature=r.temperature,
             humidity=r.humidity,
@@ -51,3 +131,72 @@ async def get_readings(limit: int = 100, db: AsyncSession = Depends(get_db)):
         )
         for r in rows
     ]
+    kind = codec.preferred(request.headers.get("accept"))
+    return out if kind == codec.JSON else codec.encode_readings(kind, out)
+
+
+@router.get("/plot", response_model=PlotOut)
+async def get_readings_plot(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    points: int = Query(1000, ge=3, le=10000),
+    device_id: Optional[str] = None,
+):
+    """Return each metric over [since, until] reduced to at most `points` with LTTB."""
+    data = await timeseries.store.scan(since, until, device_id)
+    ts = data["created_at"]
+    x = ts.astype(np.int64).astype(np.float64)
+
+    series = {}
+    for name in PLOT_METRICS:
+        y = data[name]
+        present = ~np.isnan(y)
+        if not present.any():
+            continue
+        idx = np.flatnonzero(present)[lttb(x[present], y[present], points)]
+        series[name] = PlotSeries(timestamps=ts[idx].tolist(), values=y[idx].tolist())
+
+    return PlotOut(since=since, until=until, total_points=len(ts), metrics=series)
+
+
+def _nullable(values: np.ndarray) -> list[Optional[float]]:
+    return [None if np.isnan(v) else round(v, 3) for v in values.tolist()]
+
+
+@router.get("/rollup", response_model=RollupOut)
+async def get_readings_rollup(
+    bucket: str = Query("1h", pattern="^(5m|15m|1h|6h|1d)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+):
+    """Mean, min and max of each metric per time bucket over [since, until]."""
+    bucket_s = ROLLUP_BUCKETS[bucket]
+    rollup = await timeseries.store.rollup(bucket_s, since, until, device_id)
+    return RollupOut(
+        bucket_seconds=bucket_s,
+        buckets=rollup["bucket_start"].tolist(),
+        count=rollup["count"].tolist(),
+        metrics={
+            name: RollupSeries(
+                mean=_nullable(rollup[f"{name}_mean"]),
+                min=_nullable(rollup[f"{name}_min"]),
+                max=_nullable(rollup[f"{name}_max"]),
+            )
+            for name in PLOT_METRICS if f"{name}_mean" in rollup
+        },
+    )
+
+
+@router.get("/export")
+async def export_readings(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+):
+    """Stream readings as CSV in the data/raw schema, ready for scripts/data_processing.py."""
+    return StreamingResponse(
+        timeseries.store.export_csv(since, until, device_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="readings.csv"'},
+    )
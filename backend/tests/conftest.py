@@ -0,0 +1,28 @@
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Backend modules are imported flat and read their settings at import time
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="smart-plants-test-"), "test.db"))
+os.environ.setdefault("SCRIPTS_DIR", str(BACKEND_DIR.parent / "scripts"))
+sys.path.insert(0, str(BACKEND_DIR))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A fresh schema for each test; yields nothing, use database.SessionLocal()."""
+    async def reset():
+        async with database.engine.begin() as conn:
+            await conn.run_sync(database.Base.metadata.drop_all)
+        await database.init_db()
+
+    asyncio.run(reset())
+    yield
+    asyncio.run(database.engine.dispose())
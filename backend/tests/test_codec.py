@@ -0,0 +1,92 @@
+import json
+import math
+
+import numpy as np
+import pytest
+from fastapi.exceptions import RequestValidationError
+
+import codec
+
+VALID = {"device_id": "esp-1", "moisture": 42.5, "temperature": 21.0, "humidity": 55.0, "light": 120.0}
+
+CASES = [
+    ("valid", VALID, True),
+    ("no light", {k: v for k, v in VALID.items() if k != "light"}, True),
+    ("id at limit", {**VALID, "device_id": "x" * 64}, True),
+    ("id too long", {**VALID, "device_id": "x" * 65}, False),
+    ("moisture above range", {**VALID, "moisture": 100.5}, False),
+    ("negative light", {**VALID, "light": -1.0}, False),
+    ("missing humidity", {k: v for k, v in VALID.items() if k != "humidity"}, False),
+    ("infinite temperature", {**VALID, "temperature": math.inf}, False),
+    ("nan temperature", {**VALID, "temperature": math.nan}, False),
+    ("string moisture", {**VALID, "moisture": "wet"}, False),
+]
+
+ENCODERS = {codec.JSON: lambda body: json.dumps(body).encode()}
+if codec.msgpack is not None:
+    ENCODERS[codec.MSGPACK] = codec.msgpack.packb
+if codec.cbor2 is not None:
+    ENCODERS[codec.CBOR] = codec.cbor2.dumps
+
+
+def _decode(kind, body, batch):
+    try:
+        return codec.decode(kind, ENCODERS[kind](body), "header-device", batch=batch)
+    except RequestValidationError:
+        return None
+
+
+@pytest.mark.parametrize("name, reading, accepted", CASES, ids=[c[0] for c in CASES])
+@pytest.mark.parametrize("batch", [False, True], ids=["single", "batch"])
+def test_every_format_validates_like_json(name, reading, accepted, batch):
+    body = [reading] if batch else reading
+    results = {kind: _decode(kind, body, batch) for kind in ENCODERS}
+    assert {kind: r is not None for kind, r in results.items()} == {kind: accepted for kind in ENCODERS}
+    if accepted:
+        rows = [r.rows() for r in results.values()]
+        assert all(row == rows[0] for row in rows)
+
+
+def test_device_id_is_not_truncated():
+    if codec.MSGPACK not in ENCODERS:
+        pytest.skip("msgpack not installed")
+    with pytest.raises(RequestValidationError):
+        codec.decode(codec.MSGPACK, codec.msgpack.packb({**VALID, "device_id": "p" * 80}), "d", batch=False)
+
+
+def test_binary_objects_without_device_id_use_header_device():
+    if codec.MSGPACK not in ENCODERS:
+        pytest.skip("msgpack not installed")
+    reading = {k: v for k, v in VALID.items() if k != "device_id"}
+    batch = codec.decode(codec.MSGPACK, codec.msgpack.packb([reading]), "header-device", batch=True)
+    assert batch.device_id == ["header-device"]
+
+
+def test_packed_frames_reject_non_finite_values():
+    frames = np.zeros(3, dtype=codec.READING_FRAME)
+    frames["moisture"], frames["humidity"] = 40.0, 50.0
+    frames["temperature"] = [20.0, np.inf, 21.0]
+    frames["light"] = [np.nan, 10.0, np.inf]  # NaN light means "no sensor"
+    batch = codec.from_frames(frames, "d")
+    assert codec.valid_mask(batch).tolist() == [True, False, False]
+    with pytest.raises(RequestValidationError):
+        codec.decode(codec.PACKED, frames.tobytes(), "d", batch=True)
+
+
+def test_header_device_id_is_length_checked():
+    assert codec.check_device_id("x" * 64) == "x" * 64
+    with pytest.raises(RequestValidationError):
+        codec.check_device_id("x" * 65)
+
+
+@pytest.mark.parametrize("kind", [k for k in ENCODERS if k != codec.JSON])
+def test_valid_binary_batches_skip_per_row_models(kind, monkeypatch):
+    monkeypatch.setattr(codec, "_readings_adapter", None)  # any call would fail
+    batch = codec.decode(kind, ENCODERS[kind]([VALID, {**VALID, "light": None}]), "d", batch=True)
+    assert len(batch) == 2 and np.isnan(batch.light[1])
+
+
+@pytest.mark.parametrize("kind", [k for k in ENCODERS if k != codec.JSON])
+def test_explicit_nan_light_is_rejected(kind):
+    with pytest.raises(RequestValidationError):
+        codec.decode(kind, ENCODERS[kind]({**VALID, "light": math.nan}), "d", batch=False)
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+import commands
+from database import SessionLocal, PumpCommand, PumpEvent
+from models import DeviceCommandOut
+
+
+def _command(command_id: str, age: timedelta) -> DeviceCommandOut:
+    return DeviceCommandOut(
+        command_id=command_id, duration_ms=1000, triggered_by="manual",
+        created_at=commands._utcnow() - age,
+    )
+
+
+async def _statuses() -> dict[str, str]:
+    async with SessionLocal() as db:
+        rows = (await db.execute(select(PumpCommand.command_id, PumpCommand.status))).all()
+    return dict(rows)
+
+
+async def _insert(device_id: str, command_id: str, age: timedelta) -> PumpCommand:
+    async with SessionLocal() as db:
+        event = PumpEvent(device_id=device_id, duration_ms=1000, triggered_by="manual")
+        db.add(event)
+        row = await commands.create(db, event, command_id)
+        row.created_at = commands._utcnow() - age
+        await db.commit()
+        return row
+
+
+def test_pending_drops_commands_past_ttl():
+    async def run():
+        bus = commands.CommandBus()
+        bus._persist_expiry = lambda: asyncio.sleep(0)  # no database here
+        bus.publish("d1", _command("old", commands.COMMAND_TTL + timedelta(seconds=1)))
+        bus.publish("d1", _command("new", timedelta(seconds=1)))
+        return [c.command_id for c in bus.pending("d1")], bus.pending("d2")
+
+    assert asyncio.run(run()) == (["new"], [])
+
+
+def test_expired_commands_are_marked_in_database(db):
+    async def run():
+        stale = await _insert("d1", "stale", commands.COMMAND_TTL + timedelta(seconds=5))
+        await _insert("d1", "fresh", timedelta(seconds=5))
+        bus = commands.CommandBus()
+        bus.publish("d1", commands._to_out(stale))
+        bus.publish("d1", _command("fresh", timedelta(seconds=5)))
+        assert [c.command_id for c in bus.pending("d1")] == ["fresh"]
+        await bus._expiring
+        return await _statuses()
+
+    assert asyncio.run(run()) == {"stale": "expired", "fresh": "pending"}
+
+
+def test_load_pending_expires_commands_that_aged_out_while_down(db, monkeypatch):
+    monkeypatch.setattr(commands, "bus", commands.CommandBus())
+
+    async def run():
+        await _insert("d1", "stale", commands.COMMAND_TTL + timedelta(seconds=5))
+        await _insert("d1", "fresh", timedelta(seconds=5))
+        await commands.load_pending()
+        return [c.command_id for c in commands.bus.pending("d1")], await _statuses()
+
+    assert asyncio.run(run()) == (["fresh"], {"stale": "expired", "fresh": "pending"})
+
+
+def test_reused_command_id_is_idempotent_per_device(db):
+    async def run():
+        async with SessionLocal() as db:
+            event = PumpEvent(device_id="d1", duration_ms=1000, triggered_by="manual")
+            first, command = await commands.create_event_with_command(db, event, "cmd-1")
+        async with SessionLocal() as db:
+            retry = PumpEvent(device_id="d1", duration_ms=1000, triggered_by="manual")
+            again, same = await commands.create_event_with_command(db, retry, "cmd-1")
+        assert (again.id, same.command_id) == (first.id, command.command_id)
+
+        async with SessionLocal() as db:
+            other = PumpEvent(device_id="d2", duration_ms=1000, triggered_by="manual")
+            with pytest.raises(commands.CommandIdConflict):
+                await commands.create_event_with_command(db, other, "cmd-1")
+
+    asyncio.run(run())
+
+
+def test_ack_after_expiry_is_recorded_as_late(db):
+    async def run():
+        await _insert("d1", "stale", commands.COMMAND_TTL + timedelta(seconds=5))
+        await _insert("d1", "fresh", timedelta(seconds=5))
+        await commands.expire_stale()
+        async with SessionLocal() as db_:
+            late = (await commands.ack(db_, "d1", "stale")).status
+            again = (await commands.ack(db_, "d1", "stale")).status
+            on_time = (await commands.ack(db_, "d1", "fresh")).status
+        return late, again, on_time, await _statuses()
+
+    assert asyncio.run(run()) == ("late_ack", "late_ack", "acked", {"stale": "late_ack", "fresh": "acked"})
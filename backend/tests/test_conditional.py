@@ -0,0 +1,62 @@
+from email.utils import formatdate
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import conditional
+import database
+from conditional import ConditionalGetMiddleware, _last_modified, _not_modified_since
+
+
+def test_not_modified_since_compares_full_precision():
+    since = formatdate(1_700_000_000, usegmt=True)
+    assert _not_modified_since(since, 1_700_000_000.0)
+    assert _not_modified_since(since, 1_699_999_999.9)
+    # A write later in the same second as the client's date is a change
+    assert not _not_modified_since(since, 1_700_000_000.4)
+
+
+def test_not_modified_since_ignores_bad_dates():
+    assert not _not_modified_since("yesterday", 0.0)
+
+
+def test_last_modified_rounds_up_and_waits_for_the_second_to_pass():
+    assert _last_modified(100.2, now=100.9) == []
+    assert _last_modified(100.2, now=101.0) == [(b"last-modified", formatdate(101, usegmt=True).encode())]
+
+
+def _client(monkeypatch, clock):
+    monkeypatch.setattr(database, "table_versions", {"t": 1})
+    monkeypatch.setattr(database, "table_changed_at", {"t": 1_700_000_000.3})
+    monkeypatch.setattr(conditional.time, "time", lambda: clock[0])
+    app = Starlette(routes=[Route("/items", lambda request: JSONResponse([database.table_versions["t"]]))])
+    return TestClient(ConditionalGetMiddleware(app, {"/items": ("t",)}))
+
+
+def test_second_write_in_same_second_is_not_hidden(monkeypatch):
+    clock = [1_700_000_000.5]
+    client = _client(monkeypatch, clock)
+    first = client.get("/items")
+    assert "last-modified" not in first.headers  # the write's second hasn't passed yet
+
+    # Another write lands in the same second; a client quoting that second must not get a 304
+    database.table_versions["t"] = 2
+    database.table_changed_at["t"] = 1_700_000_000.8
+    clock[0] = 1_700_000_002.0
+    stale = client.get("/items", headers={"If-Modified-Since": formatdate(1_700_000_000, usegmt=True)})
+    assert stale.status_code == 200 and stale.json() == [2]
+
+    lm = stale.headers["last-modified"]
+    assert lm == formatdate(1_700_000_001, usegmt=True)
+    assert client.get("/items", headers={"If-Modified-Since": lm}).status_code == 304
+
+
+def test_if_none_match_takes_precedence(monkeypatch):
+    client = _client(monkeypatch, [1_700_000_005.0])
+    etag = client.get("/items").headers["etag"]
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 304
+    old = formatdate(0, usegmt=True)
+    assert client.get("/items", headers={"If-None-Match": etag, "If-Modified-Since": old}).status_code == 304
+    assert client.get("/items", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+sys.path.insert(0, os.environ["SCRIPTS_DIR"])
+registry = pytest.importorskip("registry")  # scripts/registry.py needs numpy via artifacts
+
+
+def _register(args):
+    manifest, key, checkpoint, scaler = args
+    return registry.register(key, Path(checkpoint), Path(scaler), path=Path(manifest))
+
+
+def test_concurrent_registrations_get_distinct_versions(tmp_path):
+    checkpoint, scaler = tmp_path / "model.pt", tmp_path / "scaler.pkl"
+    checkpoint.write_bytes(b"weights")
+    scaler.write_bytes(b"scaler")
+    manifest = tmp_path / "models" / "manifest.json"
+
+    jobs = [(str(manifest), key, str(checkpoint), str(scaler)) for key in ("default", "species:basil") * 6]
+    with ProcessPoolExecutor(4) as pool:
+        versions = list(pool.map(_register, jobs))
+
+    saved = registry.read_manifest(manifest)
+    assert sorted(versions[0::2]) == sorted(versions[1::2]) == [1, 2, 3, 4, 5, 6]
+    assert {k: sorted(map(int, e["versions"])) for k, e in saved["models"].items()} == {
+        "default": [1, 2, 3, 4, 5, 6],
+        "species:basil": [1, 2, 3, 4, 5, 6],
+    }
+    assert saved["revision"] == 12
+    assert sorted(p.name for p in manifest.parent.iterdir()) == ["manifest.json", "manifest.json.lock", "registry"]
+
+
+def test_backend_starts_without_scripts_dir(tmp_path):
+    env = {**os.environ, "SCRIPTS_DIR": str(tmp_path / "missing"), "PYTHONPATH": ""}
+    code = "import forecasting, main; forecasting.start(); print(forecasting.scheduler)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "None"
+
+
+class Stub:
+    def __init__(self, checkpoint, scaler, nbytes=2**20):
+        self.checkpoint, self.nbytes = checkpoint, nbytes
+
+
+class Loader:
+    def __init__(self, fail=()):
+        self.calls, self.fail = [], set(fail)
+
+    def __call__(self, checkpoint, scaler):
+        self.calls.append(checkpoint)
+        time.sleep(0.05)  # long enough for concurrent gets to pile up
+        if Path(checkpoint).parent.name in self.fail:
+            raise RuntimeError(f"cannot load {checkpoint}")
+        return Stub(checkpoint, scaler)
+
+
+@pytest.fixture
+def serving(tmp_path, monkeypatch):
+    import model_registry
+
+    monkeypatch.setattr(model_registry, "MODEL_PATH", str(tmp_path / "missing.pt"))
+    monkeypatch.setattr(model_registry, "MODEL_CACHE_MB", 2)  # two stub models
+    manifest = tmp_path / "models" / "manifest.json"
+    (tmp_path / "model.pt").write_bytes(b"w")
+    (tmp_path / "scaler.pkl").write_bytes(b"s")
+
+    def publish(key, promote=True):
+        version = registry.register(key, tmp_path / "model.pt", tmp_path / "scaler.pkl", path=manifest)
+        if promote:
+            registry.promote(key, version, path=manifest)
+        return version
+
+    return model_registry, manifest, publish
+
+
+def _version(model):
+    return int(Path(model.checkpoint).parent.name[1:])
+
+
+def test_concurrent_gets_share_one_load(serving):
+    model_registry, manifest, publish = serving
+    publish("default")
+    loader = Loader()
+    models = model_registry.ModelRegistry(loader, str(manifest))
+
+    async def run():
+        return await asyncio.gather(*(models.get(f"esp-{i}") for i in range(5)))
+
+    results = asyncio.run(run())
+    assert len(loader.calls) == 1 and all(r is results[0] for r in results)
+
+
+def test_cache_is_bounded_by_bytes_in_lru_order(serving):
+    model_registry, manifest, publish = serving
+    for device in ("a", "b", "c"):
+        publish(f"device:{device}")
+    models = model_registry.ModelRegistry(Loader(), str(manifest))
+
+    async def run():
+        await models.get("a")
+        await models.get("b")
+        await models.get("a")  # b is now least recently used
+        await models.get("c")
+
+    asyncio.run(run())
+    assert sorted(key for key, _ in models._cache) == ["device:a", "device:c"]
+    assert models._bytes == 2 * 2**20
+
+
+def test_promotion_swaps_without_evicting_live_models(serving):
+    model_registry, manifest, publish = serving
+    publish("device:b")
+    publish("device:c")
+    models = model_registry.ModelRegistry(Loader(), str(manifest))
+
+    async def run():
+        await models.get("b")
+        await models.get("c")
+        publish("device:c")  # c v2; warming it must push out c v1, not b
+        await models._swap(registry.read_manifest(manifest))
+        return await models.get("c")
+
+    assert _version(asyncio.run(run())) == 2
+    assert sorted(models._cache) == [("device:b", 1), ("device:c", 2)]
+
+
+def test_missing_promoted_version_keeps_the_old_one(serving):
+    model_registry, manifest, publish = serving
+    publish("default")
+    models = model_registry.ModelRegistry(Loader(), str(manifest))
+    broken = registry.read_manifest(manifest)
+    broken["models"]["default"]["promoted"] = 7  # never registered
+    version = publish("default", promote=False)
+    shutil.rmtree(manifest.parent / "registry" / "default" / f"v{version}")
+
+    async def run():
+        await models._swap(broken)
+        first = await models.get("x")
+        with registry._locked(manifest):
+            m = registry.read_manifest(manifest)
+            m["models"]["default"]["promoted"] = version  # files deleted
+            registry._write_manifest(m, manifest)
+        await models._swap(registry.read_manifest(manifest))
+        return first, await models.get("x")
+
+    assert [_version(m) for m in asyncio.run(run())] == [1, 1]
+
+
+def test_broken_manifest_does_not_stop_startup(serving):
+    model_registry, manifest, publish = serving
+    publish("default")
+    m = registry.read_manifest(manifest)
+    m["models"]["default"]["promoted"] = 9
+    manifest.write_text(json.dumps(m))
+    assert model_registry.ModelRegistry(Loader(), str(manifest)).manifest["models"]["default"]["promoted"] is None
+    manifest.write_text("{not json")
+    assert model_registry.ModelRegistry(Loader(), str(manifest)).manifest is None
+
+
+def test_failed_warm_load_is_retried_on_the_next_poll(serving, monkeypatch):
+    model_registry, manifest, publish = serving
+    monkeypatch.setattr(model_registry, "MODEL_WATCH_S", 0.01)
+    publish("default")
+    loader = Loader(fail={"v2"})
+    models = model_registry.ModelRegistry(loader, str(manifest))
+
+    async def run():
+        await models.get("x")
+        models.start()
+        publish("default")
+        await asyncio.sleep(0.3)
+        held = _version(await models.get("x"))
+        loader.fail.clear()  # transient: the same manifest goes through on a later poll
+        await asyncio.sleep(0.3)
+        current = _version(await models.get("x"))
+        await models.shutdown()
+        return held, current
+
+    assert asyncio.run(run()) == (1, 2)
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import database  # noqa: E402
+import timeseries  # noqa: E402
+
+
+async def _ingest(rows: int) -> None:
+    async with database.SessionLocal() as db:
+        db.add_all(database.Reading(moisture=40, temperature=20, humidity=50) for _ in range(rows))
+        await db.commit()
+
+
+def test_compaction_is_tiered_and_defers_deleting_files_in_use(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, "COMPACT_AFTER", 4)
+    store = timeseries.ParquetReadingStore(str(tmp_path))
+    written = 0
+    write_segment = store._write_segment
+
+    def counting(table):
+        nonlocal written
+        written += table.num_rows
+        return write_segment(table)
+
+    monkeypatch.setattr(store, "_write_segment", counting)
+
+    async def run():
+        await _ingest(10)
+        await store.sync()
+        held = store.manifest  # a scan in flight on this manifest
+        store._readers[held["generation"]] = 1
+        for _ in range(99):
+            await _ingest(10)
+            await store.sync()
+        assert all(os.path.exists(tmp_path / s["file"]) for s in held["segments"])
+
+        del store._readers[held["generation"]]
+        await store.sync()
+        assert not any(os.path.exists(tmp_path / s["file"]) for s in held["segments"])
+        return len((await store.scan())["created_at"])
+
+    assert asyncio.run(run()) == 1000
+    # 10 → 40 → 160 → 640 rows: each row is rewritten once per tier, not once per compaction
+    assert written <= 4 * 1000
+    tiers = [store._tier(s["rows"]) for s in store.manifest["segments"]]
+    assert all(tiers.count(t) < timeseries.COMPACT_AFTER for t in tiers)
+
+
+async def _ingest_series(start: int, rows: int) -> None:
+    base = datetime(2024, 1, 1)
+    async with database.SessionLocal() as db:
+        db.add_all(
+            database.Reading(device_id=f"d{i % 2}", moisture=i % 100, temperature=20, humidity=50,
+                             light=None if i % 3 else float(i), created_at=base + timedelta(minutes=i))
+            for i in range(start, start + rows)
+        )
+        await db.commit()
+
+
+async def _export(store, **kwargs) -> str:
+    return "".join([chunk async for chunk in store.export_csv(**kwargs)])
+
+
+def _expected_csv(data) -> str:
+    return ",".join(timeseries.EXPORT_COLUMNS) + "\n" + timeseries._csv_chunk(data)
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "parquet"])
+def test_export_streams_in_batches_and_matches_scan(kind, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, "EXPORT_BATCH", 7)
+    store = timeseries.SQLiteReadingStore() if kind == "sqlite" else timeseries.ParquetReadingStore(str(tmp_path))
+    filters = {"since": datetime(2024, 1, 1, 0, 10), "until": datetime(2024, 1, 1, 1, 30), "device_id": "d1"}
+
+    async def run():
+        await _ingest_series(0, 60)
+        if kind == "parquet":
+            await store.sync()
+        await _ingest_series(60, 40)  # not mirrored yet: comes from the SQLite tail
+        batches = [len(b["created_at"]) async for b in store.scan_batches()]
+        return batches, await _export(store), await store.scan(), await _export(store, **filters), \
+            await store.scan(**filters)
+
+    batches, full, data, filtered, filtered_data = asyncio.run(run())
+    assert sum(batches) == 100 and max(batches) <= 7
+    assert full == _expected_csv(data)
+    assert filtered == _expected_csv(filtered_data) and len(filtered_data["created_at"]) == 40
+
+
+def test_export_holds_its_manifest_until_done(db, tmp_path):
+    store = timeseries.ParquetReadingStore(str(tmp_path))
+
+    async def run():
+        await _ingest_series(0, 10)
+        await store.sync()
+        export = store.export_csv()
+        await export.__anext__()  # header: nothing read yet
+        await export.__anext__()
+        held = dict(store._readers)
+        await export.aclose()  # client went away
+        return held, dict(store._readers)
+
+    held, after = asyncio.run(run())
+    assert held == {store.manifest["generation"]: 1} and after == {}
@@ -0,0 +1,69 @@
+import numpy as np
+
+import codec
+import metrics
+import udp_ingest
+from udp_ingest import Deduplicator, WINDOW
+
+
+def _accept_all(dedup, device_id, boot, seqs):
+    return [dedup.accept(device_id, boot, s) for s in seqs]
+
+
+def test_in_order_and_duplicates():
+    dedup = Deduplicator()
+    assert _accept_all(dedup, "d", 1, [0, 1, 2, 2, 1]) == ["started", "accepted", "accepted", "duplicate", "duplicate"]
+
+
+def test_reboot_after_a_few_datagrams_keeps_readings():
+    dedup = Deduplicator()
+    _accept_all(dedup, "d", 111, range(10))
+    # Fewer than WINDOW datagrams before the reboot; the counter starts again at 0
+    assert _accept_all(dedup, "d", 222, range(5)) == ["started"] + ["accepted"] * 4
+
+
+def test_late_datagram_from_previous_boot_is_deduplicated_in_its_own_window():
+    dedup = Deduplicator()
+    _accept_all(dedup, "d", 111, [0, 1, 3])
+    _accept_all(dedup, "d", 222, [0, 1])
+    assert dedup.accept("d", 111, 2) == "reordered"
+    assert dedup.accept("d", 111, 2) == "duplicate"
+
+
+def test_reordering_never_makes_counters_negative():
+    dedup = Deduplicator()
+    skipped = metrics.UDP_SEQ_SKIPPED.get()
+    assert _accept_all(dedup, "d", 1, [0, 4, 1, 3, 2]) == ["started", "accepted", "reordered", "reordered", "reordered"]
+    assert metrics.UDP_SEQ_SKIPPED.get() - skipped == 3
+    assert all(v >= 0 for v in metrics.UDP_SEQ_SKIPPED._values.values())
+
+
+def test_far_behind_the_window_is_stale():
+    dedup = Deduplicator()
+    _accept_all(dedup, "d", 1, [0, WINDOW + 5])
+    assert dedup.accept("d", 1, 1) == "stale"
+
+
+def test_windows_are_lru_bounded():
+    dedup = Deduplicator(max_windows=2)
+    dedup.accept("a", 1, 0)
+    dedup.accept("b", 1, 0)
+    dedup.accept("a", 1, 1)  # touch a, so b is least recently used
+    dedup.accept("c", 1, 0)
+    assert set(dedup._windows) == {("a", 1), ("c", 1)}
+
+
+def _datagram(device_id: bytes, boot: int, seq: int, frames: int = 1) -> bytes:
+    body = np.zeros(frames, dtype=codec.READING_FRAME)
+    body["moisture"], body["temperature"], body["humidity"], body["light"] = 40.0, 20.0, 50.0, np.nan
+    return udp_ingest.HEADER.pack(device_id, boot, seq) + body.tobytes()
+
+
+def test_pending_rows_are_bounded(monkeypatch):
+    monkeypatch.setattr(udp_ingest, "UDP_MAX_PENDING", 3)
+    protocol = udp_ingest.UdpIngestProtocol()
+    dropped = metrics.UDP_READINGS_DROPPED.get()
+    for seq in range(3):
+        protocol.datagram_received(_datagram(b"d", 7, seq, frames=2), None)
+    assert protocol.pending_rows == 2
+    assert metrics.UDP_READINGS_DROPPED.get() - dropped == 4
@@ -0,0 +1,414 @@
+"""
+Read-side storage for analytic queries over `readings`.
+
+SQLite stays the system of record and every ingest path writes there. This
+module serves range scans, rollups and exports through a ReadingStore:
+
+- SQLiteReadingStore (default): column-only SQL queries.
+- ParquetReadingStore (READINGS_STORE=parquet, needs pyarrow): an append-only
+  columnar mirror under READINGS_PARQUET_DIR. A background task copies new
+  rows across by id every READINGS_SYNC_S seconds into zstd Parquet segments.
+  A JSON manifest records each segment's id and time range. Small segments
+  are compacted by size tier: COMPACT_AFTER segments of similar size merge
+  into one of the next tier, so a row is rewritten about log(SEGMENT_ROWS)
+  times in total rather than on every compaction. Scans skip segments outside
+  the requested range. Rows not yet mirrored are read from SQLite, so results
+  are never stale.
+
+Scans return numpy columns: `created_at` as datetime64[ms], metrics as float64
+with NaN for missing light. Exports stream the same columns in batches of
+EXPORT_BATCH rows (SQLite pages, Parquet record batches), so memory stays flat
+however large the range.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import numpy as np
+from sqlalchemy import select, tuple_
+
+from database import SessionLocal, Reading
+
+log = logging.getLogger(__name__)
+
+METRICS = ("moisture", "temperature", "humidity", "light")
+EXPORT_COLUMNS = ("timestamp",) + METRICS  # the raw CSV schema scripts/data_processing.py reads
+
+READINGS_STORE = os.getenv("READINGS_STORE", "sqlite")
+READINGS_PARQUET_DIR = os.getenv("READINGS_PARQUET_DIR", "../data/columnar/readings")
+READINGS_SYNC_S = float(os.getenv("READINGS_SYNC_S", "5"))
+SEGMENT_ROWS = int(os.getenv("READINGS_SEGMENT_ROWS", "500000"))
+SYNC_CHUNK = 50000
+COMPACT_AFTER = 8  # segments of one size tier tolerated before they are merged (also the tier ratio)
+EXPORT_BATCH = 10000
+
+
+def _empty() -> dict[str, np.ndarray]:
+    out = {"created_at": np.array([], dtype="datetime64[ms]")}
+    out.update({m: np.array([], dtype=np.float64) for m in METRICS})
+    return out
+
+
+def _from_rows(rows) -> dict[str, np.ndarray]:
+    if not rows:
+        return _empty()
+    out = {"created_at": np.array([r[0] for r in rows], dtype="datetime64[ms]")}
+    values = np.array([r[1:] for r in rows], dtype=np.float64)  # None -> NaN
+    out.update({m: values[:, i] for i, m in enumerate(METRICS)})
+    return out
+
+
+def _concat(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    parts = [p for p in parts if len(p["created_at"])]
+    if not parts:
+        return _empty()
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def rollup_arrays(data: dict[str, np.ndarray], bucket_s: int) -> dict[str, np.ndarray]:
+    """Mean/min/max/count per metric per time bucket, vectorised with reduceat."""
+    ts = data["created_at"]
+    if not len(ts):
+        return {"bucket_start": np.array([], dtype="datetime64[s]"), "count": np.array([], dtype=np.int64)}
+    order = np.argsort(ts, kind="stable")
+    keys = ts[order].astype("datetime64[s]").astype(np.int64) // bucket_s
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    out = {
+        "bucket_start": (keys[starts] * bucket_s).astype("datetime64[s]"),
+        "count": np.diff(np.r_[starts, len(keys)]),
+    }
+    for m in METRICS:
+        v = data[m][order]
+        present = ~np.isnan(v)
+        n = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[f"{m}_mean"] = np.add.reduceat(np.where(present, v, 0.0), starts) / n
+        out[f"{m}_min"] = np.fmin.reduceat(np.where(present, v, np.nan), starts)
+        out[f"{m}_max"] = np.fmax.reduceat(np.where(present, v, np.nan), starts)
+    return out
+
+
+def _csv_chunk(data: dict[str, np.ndarray]) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    ts = np.datetime_as_string(data["created_at"], unit="s")
+    cols = [np.char.replace(ts, "T", " ")] + [data[m] for m in METRICS]
+    for row in zip(*cols):
+        writer.writerow([row[0]] + ["" if np.isnan(v) else f"{v:.3f}" for v in row[1:]])
+    return buf.getvalue()
+
+
+def _range_filter(query, since, until, device_id):
+    if since is not None:
+        query = query.where(Reading.created_at >= since)
+    if until is not None:
+        query = query.where(Reading.created_at <= until)
+    if device_id is not None:
+        query = query.where(Reading.device_id == device_id)
+    return query
+
+
+class SQLiteReadingStore:
+    name = "sqlite"
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def _scan_sql(self, since, until, device_id, after_id: Optional[int] = None):
+        query = select(Reading.created_at, *(getattr(Reading, m) for m in METRICS))
+        query = _range_filter(query, since, until, device_id)
+        if after_id is not None:
+            query = query.where(Reading.id > after_id)
+        async with SessionLocal() as db:
+            rows = (await db.execute(query.order_by(Reading.created_at))).all()
+        return _from_rows(rows)
+
+    async def _scan_sql_batches(self, since, until, device_id,
+                                after_id: Optional[int] = None) -> AsyncIterator[dict[str, np.ndarray]]:
+        """Like _scan_sql, one EXPORT_BATCH page at a time, keyed on (created_at, id)."""
+        query = select(Reading.created_at, *(getattr(Reading, m) for m in METRICS), Reading.id)
+        query = _range_filter(query, since, until, device_id)
+        if after_id is not None:
+            query = query.where(Reading.id > after_id)
+        last = None
+        while True:
+            page = query if last is None else query.where(tuple_(Reading.created_at, Reading.id) > last)
+            async with SessionLocal() as db:
+                rows = (await db.execute(
+                    page.order_by(Reading.created_at, Reading.id).limit(EXPORT_BATCH)
+                )).all()
+            if not rows:
+                return
+            last = (rows[-1][0], rows[-1][-1])
+            yield _from_rows([r[:-1] for r in rows])
+
+    async def scan(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   device_id: Optional[str] = None) -> dict[str, np.ndarray]:
+        return await self._scan_sql(since, until, device_id)
+
+    def scan_batches(self, since=None, until=None, device_id=None) -> AsyncIterator[dict[str, np.ndarray]]:
+        """The rows scan() returns, in batches of at most EXPORT_BATCH."""
+        return self._scan_sql_batches(since, until, device_id)
+
+    async def rollup(self, bucket_s: int, since=None, until=None, device_id=None) -> dict[str, np.ndarray]:
+        return rollup_arrays(await self.scan(since, until, device_id), bucket_s)
+
+    async def export_csv(self, since=None, until=None, device_id=None) -> AsyncIterator[str]:
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+        # aclosing: a client that disconnects mid-export releases the scan (and its manifest) right away
+        async with aclosing(self.scan_batches(since, until, device_id)) as batches:
+            async for batch in batches:
+                yield _csv_chunk(batch)
+
+
+class ParquetReadingStore(SQLiteReadingStore):
+    name = "parquet"
+
+    def __init__(self, root: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa, self._pq = pa, pq
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        self.manifest = {"version": 1, "synced_id": 0, "segments": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        # Files replaced by compaction, with the last manifest generation that still lists them
+        self._garbage: list[tuple[int, list[str]]] = []
+        self._readers: dict[int, int] = {}  # manifest generation -> scans in flight
+        self._task: Optional[asyncio.Task] = None
+
+    # ── Writing ──────────────────────────────────────────────────────────────
+
+    def _write_manifest(self, manifest: dict) -> None:
+        manifest["generation"] = self.manifest.get("generation", 0) + 1
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+        self.manifest = manifest  # readers take a reference, so swapping is atomic for them
+
+    def _write_segment(self, table) -> dict:
+        ids = table.column("id").to_numpy()
+        ts = table.column("created_at").to_numpy()
+        name = f"seg-{int(ids.min()):012d}-{int(ids.max()):012d}.parquet"
+        self._pq.write_table(table, os.path.join(self.root, name), compression="zstd")
+        return {
+            "file": name, "rows": table.num_rows,
+            "min_id": int(ids.min()), "max_id": int(ids.max()),
+            "min_ts": str(ts.min()), "max_ts": str(ts.max()),
+        }
+
+    def _table(self, rows):
+        pa = self._pa
+        return pa.table({
+            "id": pa.array([r[0] for r in rows], pa.int64()),
+            "device_id": pa.array([r[1] for r in rows], pa.string()),
+            "created_at": pa.array(np.array([r[2] for r in rows], dtype="datetime64[ms]")),
+            **{m: pa.array(np.array([r[3 + i] for r in rows], dtype=np.float64), from_pandas=True)
+               for i, m in enumerate(METRICS)},
+        })
+
+    async def sync(self) -> int:
+        """Mirror rows with id above the high-water mark; returns rows copied."""
+        self._collect_garbage()
+
+        copied = 0
+        while True:
+            synced_id = self.manifest["synced_id"]
+            async with SessionLocal() as db:
+                rows = (await db.execute(
+                    select(Reading.id, Reading.device_id, Reading.created_at,
+                           *(getattr(Reading, m) for m in METRICS))
+                    .where(Reading.id > synced_id).order_by(Reading.id).limit(SYNC_CHUNK)
+                )).all()
+            if not rows:
+                break
+            segment = await asyncio.to_thread(lambda: self._write_segment(self._table(rows)))
+            manifest = dict(self.manifest)
+            manifest["segments"] = self.manifest["segments"] + [segment]
+            manifest["synced_id"] = segment["max_id"]
+            self._write_manifest(manifest)
+            copied += len(rows)
+        await asyncio.to_thread(self._compact)
+        return copied
+
+    @staticmethod
+    def _tier(rows: int) -> int:
+        tier = 0
+        while rows >= COMPACT_AFTER:
+            rows //= COMPACT_AFTER
+            tier += 1
+        return tier
+
+    def _compact(self) -> None:
+        while True:
+            tiers: dict[int, list[dict]] = {}
+            for s in self.manifest["segments"]:
+                if s["rows"] < SEGMENT_ROWS:
+                    tiers.setdefault(self._tier(s["rows"]), []).append(s)
+            full = [tier for tier, group in tiers.items() if len(group) >= COMPACT_AFTER]
+            if not full:
+                return
+            # Oldest segments of the lowest full tier; the result may fill the next tier up
+            small = sorted(tiers[min(full)], key=lambda s: s["min_id"])[:COMPACT_AFTER]
+            table = self._pa.concat_tables(
+                [self._pq.read_table(os.path.join(self.root, s["file"])) for s in small]
+            )
+            merged = self._write_segment(table)
+            replaced = {s["file"] for s in small}
+            retired_after = self.manifest.get("generation", 0)
+            manifest = dict(self.manifest)
+            manifest["segments"] = sorted(
+                [s for s in self.manifest["segments"] if s["file"] not in replaced] + [merged],
+                key=lambda s: s["min_id"],
+            )
+            self._write_manifest(manifest)
+            self._garbage.append((retired_after, [os.path.join(self.root, f) for f in replaced if f != merged["file"]]))
+
+    def _collect_garbage(self) -> None:
+        """Delete replaced files once no scan still holds a manifest that lists them."""
+        oldest = min(self._readers, default=None)
+        keep = []
+        for generation, paths in self._garbage:
+            if oldest is not None and oldest <= generation:
+                keep.append((generation, paths))
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._garbage = keep
+
+    async def _sync_forever(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                log.exception("Columnar readings sync failed")
+            await asyncio.sleep(READINGS_SYNC_S)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # ── Reading ──────────────────────────────────────────────────────────────
+
+    def _read_segments(self, segments: list[dict], since, until, device_id) -> dict[str, np.ndarray]:
+        filters = []
+        if since is not None:
+            filters.append(("created_at", ">=", np.datetime64(since, "ms")))
+        if until is not None:
+            filters.append(("created_at", "<=", np.datetime64(until, "ms")))
+        if device_id is not None:
+            filters.append(("device_id", "==", device_id))
+        parts = []
+        for s in segments:
+            table = self._pq.read_table(
+                os.path.join(self.root, s["file"]),
+                columns=["created_at", *METRICS], filters=filters or None,
+            )
+            part = {"created_at": table.column("created_at").to_numpy().astype("datetime64[ms]")}
+            part.update({m: table.column(m).to_numpy(zero_copy_only=False).astype(np.float64) for m in METRICS})
+            parts.append(part)
+        return _concat(parts)
+
+    def _hold(self) -> dict:
+        """The current manifest, with its files protected from deletion until _release()."""
+        manifest = self.manifest
+        generation = manifest.get("generation", 0)
+        self._readers[generation] = self._readers.get(generation, 0) + 1
+        return manifest
+
+    def _release(self, manifest: dict) -> None:
+        generation = manifest.get("generation", 0)
+        self._readers[generation] -= 1
+        if not self._readers[generation]:
+            del self._readers[generation]
+
+    async def scan(self, since=None, until=None, device_id=None) -> dict[str, np.ndarray]:
+        manifest = self._hold()
+        try:
+            return await self._scan_manifest(manifest, since, until, device_id)
+        finally:
+            self._release(manifest)
+
+    @staticmethod
+    def _overlapping(manifest: dict, since, until) -> list[dict]:
+        lo = np.datetime64(since, "ms") if since is not None else None
+        hi = np.datetime64(until, "ms") if until is not None else None
+        return [
+            s for s in manifest["segments"]
+            if (lo is None or np.datetime64(s["max_ts"]) >= lo) and (hi is None or np.datetime64(s["min_ts"]) <= hi)
+        ]
+
+    def _segment_batches(self, segment: dict, since, until, device_id):
+        """Record batches of one segment as numpy columns, filtered like _read_segments."""
+        columns = ["created_at", *METRICS] + (["device_id"] if device_id is not None else [])
+        parquet = self._pq.ParquetFile(os.path.join(self.root, segment["file"]))
+        for batch in parquet.iter_batches(batch_size=EXPORT_BATCH, columns=columns):
+            ts = batch.column("created_at").to_numpy().astype("datetime64[ms]")
+            keep = np.ones(len(ts), dtype=bool)
+            if since is not None:
+                keep &= ts >= np.datetime64(since, "ms")
+            if until is not None:
+                keep &= ts <= np.datetime64(until, "ms")
+            if device_id is not None:
+                keep &= batch.column("device_id").to_numpy(zero_copy_only=False) == device_id
+            if keep.any():
+                part = {"created_at": ts[keep]}
+                part.update({
+                    m: batch.column(m).to_numpy(zero_copy_only=False).astype(np.float64)[keep] for m in METRICS
+                })
+                yield part
+
+    async def scan_batches(self, since=None, until=None, device_id=None) -> AsyncIterator[dict[str, np.ndarray]]:
+        """Segments in id (arrival) order one record batch at a time, then the unmirrored tail."""
+        manifest = self._hold()  # held until the last batch, so compaction can't delete a file mid-export
+        try:
+            for segment in self._overlapping(manifest, since, until):
+                batches = self._segment_batches(segment, since, until, device_id)
+                while (part := await asyncio.to_thread(next, batches, None)) is not None:
+                    yield part
+            async for part in self._scan_sql_batches(since, until, device_id, after_id=manifest["synced_id"]):
+                yield part
+        finally:
+            self._release(manifest)
+
+    async def _scan_manifest(self, manifest: dict, since, until, device_id) -> dict[str, np.ndarray]:
+        segments = self._overlapping(manifest, since, until)
+        mirrored = await asyncio.to_thread(self._read_segments, segments, since, until, device_id)
+        tail = await self._scan_sql(since, until, device_id, after_id=manifest["synced_id"])
+        data = _concat([mirrored, tail])
+        order = np.argsort(data["created_at"], kind="stable")
+        return {k: v[order] for k, v in data.items()}
+
+
+def _create_store():
+    if READINGS_STORE == "parquet":
+        try:
+            return ParquetReadingStore(READINGS_PARQUET_DIR)
+        except ImportError:
+            log.warning("READINGS_STORE=parquet needs pyarrow; falling back to SQLite scans")
+    return SQLiteReadingStore()
+
+
+store = _create_store()
@@ -0,0 +1,182 @@
+"""
+Optional UDP datagram listener for fire-and-forget sensor telemetry.
+
+Enabled by setting UDP_INGEST_PORT. Each datagram is a 24-byte header followed
+by one or more codec.READING_FRAME frames:
+
+    char[16] device_id (ASCII, NUL-padded) | uint32 boot | uint32 seq (little-endian) | frames...
+
+`boot` is a random value the sender picks at power-up; seq starts at 0 and is
+incremented once per datagram. Datagrams are validated with the same rules as
+ReadingIn and de-duplicated with a sliding window over seq per (device, boot),
+so a reboot opens a fresh window instead of colliding with the old counter.
+Windows are kept for the UDP_MAX_WINDOWS most recently active (device, boot)
+pairs. Accepted rows are buffered and written with the same storage path as
+POST /readings/batch, every UDP_FLUSH_S seconds or as soon as UDP_BATCH_SIZE
+rows are waiting. If storage falls behind, rows past UDP_MAX_PENDING are dropped.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+import codec
+import metrics
+from database import SessionLocal
+from routes.readings import store_batch
+
+log = logging.getLogger(__name__)
+
+UDP_INGEST_HOST = os.getenv("UDP_INGEST_HOST", "0.0.0.0")
+UDP_INGEST_PORT = int(os.getenv("UDP_INGEST_PORT", "0"))
+UDP_BATCH_SIZE = int(os.getenv("UDP_BATCH_SIZE", "500"))
+UDP_FLUSH_S = float(os.getenv("UDP_FLUSH_S", "1.0"))
+UDP_MAX_PENDING = int(os.getenv("UDP_MAX_PENDING", "50000"))  # rows buffered while a flush is slow
+UDP_MAX_WINDOWS = int(os.getenv("UDP_MAX_WINDOWS", "10000"))
+
+HEADER = struct.Struct("<16sII")
+WINDOW = 64  # seqs remembered behind the highest one seen, per device
+
+
+@dataclass
+class _SeqWindow:
+    highest: int
+    seen: int = 1  # bit i set => seq (highest - i) already received
+
+
+class Deduplicator:
+    """Anti-replay style sliding window per (device, boot); tolerates reordering within WINDOW datagrams."""
+
+    def __init__(self, max_windows: int = UDP_MAX_WINDOWS):
+        self.max_windows = max_windows
+        self._windows: OrderedDict[tuple[str, int], _SeqWindow] = OrderedDict()
+
+    def accept(self, device_id: str, boot: int, seq: int) -> str:
+        key = (device_id, boot)
+        w = self._windows.get(key)
+        if w is None:
+            # First datagram since this backend started, or the device rebooted
+            self._windows[key] = _SeqWindow(highest=seq)
+            if len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+            return "started"
+        self._windows.move_to_end(key)
+
+        if seq > w.highest:
+            gap = seq - w.highest
+            if gap > 1:
+                metrics.UDP_SEQ_SKIPPED.inc(amount=gap - 1)
+            w.seen = ((w.seen << gap) | 1) & ((1 << WINDOW) - 1) if gap < WINDOW else 1
+            w.highest = seq
+            return "accepted"
+
+        behind = w.highest - seq
+        if behind >= WINDOW:
+            return "stale"  # too old to tell apart from a replay
+        if w.seen & (1 << behind):
+            return "duplicate"
+        w.seen |= 1 << behind
+        return "reordered"
+
+
+class UdpIngestProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.dedup = Deduplicator()
+        self.pending: list[codec.ReadingBatch] = []
+        self.pending_rows = 0
+        self.flush_now = asyncio.Event()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        body = data[HEADER.size:]
+        if len(data) < HEADER.size or not body or len(body) % codec.READING_FRAME.itemsize:
+            metrics.UDP_DATAGRAMS.inc("malformed")
+            return
+        raw_id, boot, seq = HEADER.unpack_from(data)
+        device_id = raw_id.rstrip(b"\0").decode("ascii", "replace") or "default"
+
+        outcome = self.dedup.accept(device_id, boot, seq)
+        metrics.UDP_DATAGRAMS.inc(outcome)
+        if outcome in ("duplicate", "stale"):
+            return
+
+        batch = codec.from_frames(np.frombuffer(body, dtype=codec.READING_FRAME), device_id)
+        ok = codec.valid_mask(batch)
+        if not ok.all():
+            metrics.UDP_READINGS_INVALID.inc(amount=int((~ok).sum()))
+            if not ok.any():
+                return
+            batch = codec.ReadingBatch(
+                batch.moisture[ok], batch.temperature[ok], batch.humidity[ok], batch.light[ok],
+                device_id=[device_id] * int(ok.sum()),
+            )
+        if self.pending_rows + len(batch) > UDP_MAX_PENDING:
+            metrics.UDP_READINGS_DROPPED.inc(amount=len(batch))
+            self.flush_now.set()
+            return
+        self.pending.append(batch)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= UDP_BATCH_SIZE:
+            self.flush_now.set()
+
+    def take(self) -> Optional[codec.ReadingBatch]:
+        if not self.pending:
+            return None
+        batches, self.pending, self.pending_rows = self.pending, [], 0
+        return codec.ReadingBatch(
+            *(np.concatenate([getattr(b, name) for b in batches]) for name in codec.COLUMNS),
+            device_id=[d for b in batches for d in b.device_id],
+        )
+
+
+async def _flush(protocol: UdpIngestProtocol) -> None:
+    batch = protocol.take()
+    if batch is None:
+        return
+    try:
+        async with SessionLocal() as db:
+            await store_batch(db, batch)
+    except Exception:
+        metrics.UDP_READINGS_DROPPED.inc(amount=len(batch))
+        log.exception("Dropped %d UDP readings", len(batch))
+
+
+async def _flusher(protocol: UdpIngestProtocol) -> None:
+    while True:
+        try:
+            await asyncio.wait_for(protocol.flush_now.wait(), UDP_FLUSH_S)
+        except asyncio.TimeoutError:
+            pass
+        protocol.flush_now.clear()
+        await _flush(protocol)
+
+
+_transport: Optional[asyncio.DatagramTransport] = None
+_protocol: Optional[UdpIngestProtocol] = None
+_flush_task: Optional[asyncio.Task] = None
+
+
+async def start() -> None:
+    global _transport, _protocol, _flush_task
+    if not UDP_INGEST_PORT:
+        return
+    loop = asyncio.get_running_loop()
+    _transport, _protocol = await loop.create_datagram_endpoint(
+        UdpIngestProtocol, local_addr=(UDP_INGEST_HOST, UDP_INGEST_PORT),
+    )
+    _flush_task = asyncio.create_task(_flusher(_protocol))
+    log.info("UDP ingest listening on %s:%d", UDP_INGEST_HOST, UDP_INGEST_PORT)
+
+
+async def stop() -> None:
+    if _transport is None:
+        return
+    _transport.close()
+    _flush_task.cancel()
+    await asyncio.gather(_flush_task, return_exceptions=True)
+    await _flush(_protocol)
@@ -0,0 +1,56 @@
+"""
+Backend client shared by the dashboard pages.
+
+One pooled requests.Session per server process, so polls reuse keep-alive
+connections. GETs send If-None-Match with the ETag of the last body seen for
+the same URL. On a 304 the stored body is returned without the backend
+re-running the query or resending it.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+BACKEND = os.getenv("BACKEND_URL", "http://localhost:8000")
+MAX_VALIDATED = 256  # distinct URLs whose last body is kept for revalidation
+
+
+@st.cache_resource
+def _client() -> tuple[requests.Session, OrderedDict, threading.Lock]:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)  # one connection per concurrent viewer thread
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session, OrderedDict(), threading.Lock()
+
+
+def get_json(path: str, params: dict | None = None, timeout: float = 5):
+    """GET BACKEND + path as JSON. Raises requests.HTTPError on error statuses."""
+    session, validated, lock = _client()
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    key = (path, tuple(sorted((k, str(v)) for k, v in params.items())))
+    with lock:
+        cached = validated.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+
+    resp = session.get(f"{BACKEND}{path}", params=params, headers=headers, timeout=timeout)
+    if resp.status_code == 304 and cached:
+        with lock:
+            if key in validated:
+                validated.move_to_end(key)
+        return cached[1]
+    resp.raise_for_status()
+    body = resp.json()
+
+    etag = resp.headers.get("ETag")
+    if etag:
+        with lock:
+            validated[key] = (etag, body)
+            validated.move_to_end(key)
+            while len(validated) > MAX_VALIDATED:
+                validated.popitem(last=False)
+    return body
@@ -1,31 +1,138 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import requests
 import time
-import os
+import api
+from datetime import datetime, timedelta, timezone
 
-BACKEND = os.getenv("BACKEND_URL", "http://localhost:8000")
 DRY_THRESHOLD = 30.0
+REFRESH_S = 10
+MAX_POINTS = 500
 
 st.set_page_config(page_title="Live Monitor", page_icon="📡", layout="wide")
 st.title("📡 Live Monitor")
 
-auto_refresh = st.sidebar.toggle("Auto-refresh (10s)", value=False)
-limit = st.sidebar.slider("Readings to show", 20, 500, 100)
+RANGES = {
+    "Last 24 hours": timedelta(days=1),
+    "Last 7 days": timedelta(days=7),
+    "Last 30 days": timedelta(days=30),
+    "Last year": timedelta(days=365),
+    "All history": None,
+}
+
+view = st.sidebar.radio("View", ["Live", "History"], horizontal=True)
+
+
+# Cached across sessions: N viewers polling in step share one backend call per interval
+@st.cache_data(ttl=REFRESH_S, show_spinner=False)
+def fetch_window(n: int) -> list[dict]:
+    return api.get_json("/readings", {"limit": n})
+
+
+@st.cache_data(ttl=REFRESH_S, show_spinner=False)
+def fetch_newer(after_id: int) -> list[dict]:
+    return api.get_json("/readings", {"after_id": after_id, "limit": MAX_POINTS})
+
+
+def to_frame(rows: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df["created_at"] = pd.to_datetime(df["created_at"])
+        df = df.sort_values("id")
+    return df
 
 
 def fetch_readings(n: int) -> pd.DataFrame:
+    """Return the last n readings from a per-session buffer, asking the backend only for new rows."""
+    state = st.session_state
+    buf = state.get("live_buffer")
     try:
-        resp = requests.get(f"{BACKEND}/readings?limit={n}", timeout=5)
-        resp.raise_for_status()
-        df = pd.DataFrame(resp.json())
-        df["created_at"] = pd.to_datetime(df["created_at"])
-        return df.sort_values("created_at")
+        if buf is None or buf.empty or n > state.get("live_buffer_limit", 0):
+            buf = to_frame(fetch_window(n))
+            state["live_buffer_limit"] = n
+        else:
+            new = fetch_newer(int(buf["id"].iloc[-1]))
+            if new:
+                buf = pd.concat([buf, to_frame(new)], ignore_index=True).tail(MAX_POINTS)
     except Exception as e:
         st.error(f"Could not reach backend: {e}")
-        return pd.DataFrame()
+        return buf.tail(n) if buf is not None else pd.DataFrame()
+    state["live_buffer"] = buf
+    return buf.tail(n)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_plot(since: datetime | None, until: datetime | None, points: int) -> dict:
+    params = {"points": points}
+    if since is not None:
+        params["since"] = since.isoformat()
+    if until is not None:
+        params["until"] = until.isoformat()
+    return api.get_json("/readings/plot", params, timeout=30)
+
+
+def series_trace(plot: dict, metric: str, name: str, color: str, width: int = 1) -> go.Scattergl:
+    s = plot["metrics"].get(metric, {"timestamps": [], "values": []})
+    return go.Scattergl(x=pd.to_datetime(s["timestamps"]), y=s["values"],
+                        name=name, line=dict(color=color, width=width))
+
+
+if view == "History":
+    choice = st.sidebar.selectbox("Range", [*RANGES, "Custom"])
+    points = st.sidebar.slider("Points per chart", 200, 5000, 1500, step=100)
+    until = None
+    if choice == "Custom":
+        today = datetime.now().date()
+        dates = st.sidebar.date_input("Dates", (today - timedelta(days=30), today))
+        if len(dates) != 2:
+            st.info("Select an end date.")
+            st.stop()
+        start, end = dates
+        # The dates are local calendar days; created_at is naive UTC, so convert the bounds like the presets
+        since = datetime.combine(start, datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+        until = datetime.combine(end, datetime.max.time()).astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        span = RANGES[choice]
+        # created_at is stored in UTC; round to the minute so repeated views share a cache entry
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        since = (now - span).replace(second=0, microsecond=0) if span else None
+
+    try:
+        plot = fetch_plot(since, until, points)
+    except Exception as e:
+        st.error(f"Could not reach backend: {e}")
+        st.stop()
+
+    if plot["total_points"] == 0:
+        st.warning("No readings in this range.")
+        st.stop()
+
+    shown = max(len(s["values"]) for s in plot["metrics"].values())
+    st.caption(f"{plot['total_points']:,} readings, downsampled to {shown:,} points per series (LTTB)")
+
+    fig = go.Figure(series_trace(plot, "moisture", "Moisture (%)", "#2ecc71", width=2))
+    fig.add_hline(y=DRY_THRESHOLD, line_dash="dash", line_color="red",
+                  annotation_text="Dry threshold")
+    fig.update_layout(
+        title="Soil Moisture Over Time",
+        xaxis_title="Time", yaxis_title="Moisture (%)",
+        yaxis=dict(range=[0, 100]),
+        height=350, margin=dict(t=40, b=20),
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig2 = go.Figure([
+        series_trace(plot, "temperature", "Temp (°C)", "#e67e22"),
+        series_trace(plot, "humidity", "Humidity (%)", "#3498db"),
+    ])
+    fig2.update_layout(title="Temperature & Humidity", height=280,
+                       margin=dict(t=40, b=20))
+    st.plotly_chart(fig2, use_container_width=True)
+    st.stop()
+
 
+auto_refresh = st.sidebar.toggle(f"Auto-refresh ({REFRESH_S}s)", value=False)
+limit = st.sidebar.slider("Readings to show", 20, MAX_POINTS, 100)
 
 placeholder = st.empty()
 
@@ -44,7 +151,7 @@ while True:
             col3.metric("Humidity", f"{latest['humidity']:.1f}%")
 
             fig = go.Figure()
-            fig.add_trace(go.Scatter(
+            fig.add_trace(go.Scattergl(
                 x=df["created_at"], y=df["moisture"],
                 name="Moisture (%)", line=dict(color="#2ecc71", width=2),
             ))
@@ -59,15 +166,15 @@ while True:
             st.plotly_chart(fig, use_container_width=True)
 
             fig2 = go.Figure()
-            fig2.add_trace(go.Scatter(x=df["created_at"], y=df["temperature"],
-                                      name="Temp (°C)", line=dict(color="#e67e22")))
-            fig2.add_trace(go.Scatter(x=df["created_at"], y=df["humidity"],
-                                      name="Humidity (%)", line=dict(color="#3498db")))
+            fig2.add_trace(go.Scattergl(x=df["created_at"], y=df["temperature"],
+                                        name="Temp (°C)", line=dict(color="#e67e22")))
+            fig2.add_trace(go.Scattergl(x=df["created_at"], y=df["humidity"],
+                                        name="Humidity (%)", line=dict(color="#3498db")))
             fig2.update_layout(title="Temperature & Humidity", height=280,
                                 margin=dict(t=40, b=20))
             st.plotly_chart(fig2, use_container_width=True)
 
     if not auto_refresh:
         break
-    time.sleep(10)
+    time.sleep(REFRESH_S)
     st.rerun()
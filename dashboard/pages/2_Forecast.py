@@ -1,9 +1,7 @@
 import streamlit as st
 import plotly.graph_objects as go
 import requests
-import os
-
-BACKEND = os.getenv("BACKEND_URL", "http://localhost:8000")
+import api
 
 st.set_page_config(page_title="Forecast", page_icon="🔮", layout="wide")
 st.title("🔮 Moisture Forecast")
@@ -11,11 +9,12 @@ st.title("🔮 Moisture Forecast")
 
 def fetch_prediction() -> dict | None:
     try:
-        resp = requests.get(f"{BACKEND}/predictions/latest", timeout=5)
-        if resp.status_code == 404:
+        return api.get_json("/predictions/latest")
+    except requests.HTTPError as e:
+        if e.response.status_code == 404:
             return None
-        resp.raise_for_status()
-        return resp.json()
+        st.error(f"Could not reach backend: {e}")
+        return None
     except Exception as e:
         st.error(f"Could not reach backend: {e}")
         return None
@@ -33,17 +32,35 @@ else:
     forecast = pred["forecast"]
     threshold = pred["dry_threshold"]
     dry_at = pred.get("predicted_dry_at_hours")
+    bands = pred.get("bands")
 
     hours = list(range(1, horizon + 1))
 
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     col1.metric("Forecast horizon", f"{horizon} hours")
     if dry_at:
         col2.metric("Predicted dry in", f"{dry_at:.0f}h", delta="Needs water soon", delta_color="inverse")
     else:
         col2.metric("Plant status", "OK within window", delta="No watering needed", delta_color="normal")
+    if bands:
+        col3.metric(f"Chance of drying within {horizon}h", f"{bands['p_dry'][-1]:.0%}")
 
     fig = go.Figure()
+    if bands:
+        # p10 first, then p90 filled down to it
+        fig.add_trace(go.Scatter(
+            x=hours, y=bands["p10"], mode="lines", line=dict(width=0),
+            showlegend=False, hoverinfo="skip",
+        ))
+        fig.add_trace(go.Scatter(
+            x=hours, y=bands["p90"], mode="lines", line=dict(width=0),
+            fill="tonexty", fillcolor="rgba(46, 204, 113, 0.2)",
+            name=f"p10–p90 ({bands['samples']} samples)",
+        ))
+        fig.add_trace(go.Scatter(
+            x=hours, y=bands["p50"], mode="lines",
+            name="Median (p50)", line=dict(color="#27ae60", width=1, dash="dot"),
+        ))
     fig.add_trace(go.Scatter(
         x=hours, y=forecast, mode="lines+markers",
         name="Predicted moisture", line=dict(color="#2ecc71", width=2),
@@ -63,3 +80,17 @@ else:
         height=400,
     )
     st.plotly_chart(fig, use_container_width=True)
+
+    if bands:
+        dry_fig = go.Figure(go.Bar(
+            x=hours, y=[p * 100 for p in bands["p_dry"]],
+            marker_color="#e67e22", name="P(dry)",
+        ))
+        dry_fig.update_layout(
+            title="Probability of having dried out by each hour",
+            xaxis_title="Hours from now",
+            yaxis_title="P(dry) (%)",
+            yaxis=dict(range=[0, 100]),
+            height=250,
+        )
+        st.plotly_chart(dry_fig, use_container_width=True)
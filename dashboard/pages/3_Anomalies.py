@@ -1,53 +1,93 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import numpy as np
-from pathlib import Path
+import api
+from datetime import datetime, timedelta
+
+MAX_WINDOWS = 5000
+TOP_K = 20
 
 st.set_page_config(page_title="Anomalies", page_icon="⚠️", layout="wide")
 st.title("⚠️ Anomaly Detection")
 
-PROCESSED_DIR = Path("../../data/processed")
 
-errors_path    = PROCESSED_DIR / "val_errors.npy"
-threshold_path = PROCESSED_DIR / "anomaly_threshold.npy"
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch(path: str, **params) -> dict | list:
+    return api.get_json(path, params, timeout=10)
+
 
-if not errors_path.exists():
+try:
+    summary = fetch("/anomalies/summary")
+except Exception as e:
+    st.error(f"Could not reach backend: {e}")
+    st.stop()
+
+if summary["total_windows"] == 0:
     st.info(
         "No anomaly data yet. Run `python scripts/anomaly_detection.py` to compute errors.\n\n"
         "This requires a trained model and processed validation data."
     )
-else:
-    errors    = np.load(errors_path)
-    threshold = float(np.load(threshold_path)[0])
-
-    anomaly_mask = errors > threshold
-    n_anomalies  = anomaly_mask.sum()
-
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Total windows", len(errors))
-    col2.metric("Anomalies detected", int(n_anomalies))
-    col3.metric("Threshold", f"{threshold:.4f}")
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        y=errors, mode="lines", name="Reconstruction error",
-        line=dict(color="#3498db", width=1),
-    ))
-    fig.add_hline(y=threshold, line_dash="dash", line_color="red",
-                  annotation_text="Anomaly threshold")
-    anomaly_idx = np.where(anomaly_mask)[0]
-    fig.add_trace(go.Scatter(
-        x=anomaly_idx, y=errors[anomaly_idx], mode="markers",
-        name="Anomaly", marker=dict(color="red", size=6, symbol="x"),
-    ))
-    fig.update_layout(
-        title="LSTM Reconstruction Error (Validation Set)",
-        xaxis_title="Window index", yaxis_title="Absolute error",
-        height=400,
+    st.stop()
+
+threshold = summary["threshold"]
+first = datetime.fromisoformat(summary["first_window"])
+last = datetime.fromisoformat(summary["last_window"])
+
+if first < last:
+    start, end = st.sidebar.slider(
+        "Time range", min_value=first, max_value=last,
+        value=(max(first, last - timedelta(days=14)), last),
+        step=timedelta(hours=1), format="YYYY-MM-DD HH:mm",
     )
-    st.plotly_chart(fig, use_container_width=True)
+else:
+    start, end = first, last
+run_id = summary["run_id"]
+since, until = start.isoformat(), end.isoformat()
+
+try:
+    visible = fetch("/anomalies/summary", since=since, until=until, run_id=run_id)
+    windows = pd.DataFrame(fetch("/anomalies", since=since, until=until,
+                                 limit=MAX_WINDOWS, run_id=run_id))
+    top = pd.DataFrame(fetch("/anomalies/top", k=TOP_K, since=since, until=until, run_id=run_id))
+except Exception as e:
+    st.error(f"Could not reach backend: {e}")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Total windows", summary["total_windows"])
+col2.metric("Anomalies detected", summary["anomalies"])
+col3.metric("In range", f"{visible['anomalies']} / {visible['total_windows']}")
+col4.metric("Threshold", f"{threshold:.4f}")
+
+if windows.empty:
+    st.info("No scored windows in this range.")
+    st.stop()
+
+windows["window_end"] = pd.to_datetime(windows["window_end"])
+if visible["total_windows"] > len(windows):
+    st.caption(f"Showing the first {len(windows):,} of {visible['total_windows']:,} windows — narrow the range to see the rest.")
+
+flagged = windows[windows["is_anomaly"]]
+
+fig = go.Figure()
+fig.add_trace(go.Scattergl(
+    x=windows["window_end"], y=windows["score"], mode="lines", name="Reconstruction error",
+    line=dict(color="#3498db", width=1),
+))
+fig.add_hline(y=threshold, line_dash="dash", line_color="red",
+              annotation_text="Anomaly threshold")
+fig.add_trace(go.Scattergl(
+    x=flagged["window_end"], y=flagged["score"], mode="markers",
+    name="Anomaly", marker=dict(color="red", size=6, symbol="x"),
+))
+fig.update_layout(
+    title="LSTM Reconstruction Error (Validation Set)",
+    xaxis_title="Window end", yaxis_title="Absolute error",
+    height=400,
+)
+st.plotly_chart(fig, use_container_width=True)
 
-    if n_anomalies > 0:
-        df = pd.DataFrame({"window_index": anomaly_idx, "error": errors[anomaly_idx]})
-        st.dataframe(df.sort_values("error", ascending=False).reset_index(drop=True))
+if not top.empty:
+    st.subheader(f"Top {len(top)} anomalies in range")
+    top["window_end"] = pd.to_datetime(top["window_end"])
+    st.dataframe(top[["window_end", "score"]].rename(columns={"score": "error"}))
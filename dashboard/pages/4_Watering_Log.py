@@ -1,20 +1,25 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import requests
-import os
-
-BACKEND = os.getenv("BACKEND_URL", "http://localhost:8000")
+import api
 
 st.set_page_config(page_title="Watering Log", page_icon="💧", layout="wide")
 st.title("💧 Watering Log")
 
+TRIGGER_COLORS = {"manual": "#3498db", "model": "#2ecc71", "emergency": "#e74c3c"}
+
+
+def fetch_pump_stats(bucket: str) -> dict | None:
+    try:
+        return api.get_json("/pump/stats", {"bucket": bucket})
+    except Exception as e:
+        st.error(f"Could not reach backend: {e}")
+        return None
+
 
 def fetch_pump_events() -> pd.DataFrame:
     try:
-        resp = requests.get(f"{BACKEND}/pump?limit=200", timeout=5)
-        resp.raise_for_status()
-        df = pd.DataFrame(resp.json())
+        df = pd.DataFrame(api.get_json("/pump", {"limit": 200}))
         if not df.empty:
             df["created_at"] = pd.to_datetime(df["created_at"])
         return df
@@ -26,27 +31,45 @@ def fetch_pump_events() -> pd.DataFrame:
 if st.button("Refresh"):
     st.rerun()
 
-df = fetch_pump_events()
+bucket = st.sidebar.radio("Group by", ["day", "week"], horizontal=True)
+stats = fetch_pump_stats(bucket)
 
-if df.empty:
+if stats is None:
+    st.stop()
+if stats["total_events"] == 0:
     st.info("No watering events recorded yet.")
-else:
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Total events", len(df))
-    col2.metric("Total water time", f"{df['duration_ms'].sum() / 1000:.0f}s")
-    col3.metric("Last watering", df["created_at"].max().strftime("%Y-%m-%d %H:%M"))
-
-    fig = px.bar(
-        df, x="created_at", y="duration_ms", color="triggered_by",
-        title="Pump Events Over Time",
-        labels={"created_at": "Time", "duration_ms": "Duration (ms)", "triggered_by": "Trigger"},
-        color_discrete_map={"manual": "#3498db", "model": "#2ecc71", "emergency": "#e74c3c"},
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.stop()
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Total events", stats["total_events"])
+col2.metric("Total water time", f"{stats['total_duration_ms'] / 1000:.0f}s")
+col3.metric("Last watering", pd.to_datetime(stats["last_watered_at"]).strftime("%Y-%m-%d %H:%M"))
 
-    st.subheader("Event Table")
+periods = pd.DataFrame(stats["by_period"])
+periods["period_start"] = pd.to_datetime(periods["period_start"])
+fig = px.bar(
+    periods, x="period_start", y="total_duration_ms", color="triggered_by",
+    title=f"Pump Time per {bucket.capitalize()}",
+    labels={"period_start": bucket.capitalize(), "total_duration_ms": "Duration (ms)", "triggered_by": "Trigger"},
+    color_discrete_map=TRIGGER_COLORS,
+    hover_data=["events"],
+)
+st.plotly_chart(fig, use_container_width=True)
+
+left, right = st.columns(2)
+with left:
+    st.subheader("By trigger")
+    st.dataframe(pd.DataFrame(stats["by_trigger"]), hide_index=True)
+with right:
+    st.subheader("By device")
+    st.caption(f"Volume assumes {stats['flow_ml_per_s']:g} ml/s pump flow")
+    st.dataframe(pd.DataFrame(stats["by_device"]), hide_index=True)
+
+st.subheader("Recent Events")
+df = fetch_pump_events()
+if not df.empty:
     st.dataframe(
-        df[["id", "created_at", "duration_ms", "triggered_by"]]
+        df[["id", "created_at", "device_id", "duration_ms", "triggered_by"]]
         .sort_values("created_at", ascending=False)
         .reset_index(drop=True)
     )
@@ -4,57 +4,100 @@ Anomaly detection using LSTM reconstruction error.
 Strategy: train on normal data, flag windows where prediction error
 exceeds a learned threshold (mean + k*std of training errors).
 
+Validation scores are written, with the timestamp of each window, to the
+`anomalies` table the backend serves from. Each run replaces the previous one.
+The table comes from the backend's own model (database.Anomaly, found via
+BACKEND_DIR), so it is created the same way whether or not the API has run.
+
 Usage:
-  python anomaly_detection.py [--k 3.0]
+  python anomaly_detection.py [--k 3.0] [--profile]
 """
 
 import argparse
 import numpy as np
 import torch
-import pickle
+import os
+import sys
+import uuid
 from pathlib import Path
-from model import load_model
 from data_processing import FEATURES, TARGET, SEQ_LEN
+from artifacts import DATA_DIR, PROCESSED_DIR, MODELS_DIR, load_array, load_checkpoint, save_array
+from stage_profiler import profiler, stage
 
-PROCESSED_DIR = Path("../data/processed")
-MODELS_DIR    = Path("../data/models")
+DB_PATH       = os.getenv("DB_PATH", str(DATA_DIR / "smart_plants.db"))
+BACKEND_DIR   = os.getenv("BACKEND_DIR", str(Path(__file__).resolve().parent.parent / "backend"))
+BATCH_SIZE    = 1024
 
 
 def compute_errors(model, X: np.ndarray) -> np.ndarray:
     """Return per-sequence absolute prediction error on the target feature."""
     target_idx = FEATURES.index(TARGET)
     model.eval()
-    errors = []
+    preds = []
     with torch.no_grad():
-        for i in range(len(X)):
-            x = torch.tensor(X[i][np.newaxis], dtype=torch.float32)
-            pred = model(x).item()
-            actual = X[i, -1, target_idx]  # last known value as proxy
-            errors.append(abs(pred - actual))
-    return np.array(errors)
+        for start in range(0, len(X), BATCH_SIZE):
+            x = torch.tensor(X[start : start + BATCH_SIZE], dtype=torch.float32)
+            preds.append(model(x).numpy())
+    if not preds:
+        return np.zeros(0)
+    actual = X[:, -1, target_idx]  # last known value as proxy
+    return np.abs(np.concatenate(preds) - actual)
+
+
+def save_to_db(window_end: np.ndarray, errors: np.ndarray, threshold: float) -> str:
+    """Store one scoring run in the anomalies table and drop older runs."""
+    from sqlalchemy import create_engine, delete, insert
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("DB_PATH", DB_PATH)  # read by the backend's database module on import
+    from database import Anomaly
+
+    run_id = uuid.uuid4().hex[:16]
+    rows = [
+        {"run_id": run_id, "window_end": end, "score": score, "threshold": float(threshold), "is_anomaly": flag}
+        for end, score, flag in zip(
+            window_end.astype("datetime64[us]").tolist(), errors.astype(float).tolist(), (errors > threshold).tolist()
+        )
+    ]
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    try:
+        with engine.begin() as conn:
+            Anomaly.__table__.create(conn, checkfirst=True)  # with its indexes
+            if rows:
+                conn.execute(insert(Anomaly.__table__), rows)
+            conn.execute(delete(Anomaly.__table__).where(Anomaly.run_id != run_id))
+    finally:
+        engine.dispose()
+    return run_id
 
 
 def detect(k: float = 3.0):
-    model = load_model(str(MODELS_DIR / "best_model.pt"))
+    model = load_checkpoint(MODELS_DIR / "best_model.pt")
 
-    X_train = np.load(PROCESSED_DIR / "X_train.npy")
-    X_val   = np.load(PROCESSED_DIR / "X_val.npy")
+    X_train = load_array(PROCESSED_DIR / "X_train.npy")
+    X_val   = load_array(PROCESSED_DIR / "X_val.npy")
 
-    train_errors = compute_errors(model, X_train)
+    with stage("compute_errors (train)"):
+        train_errors = compute_errors(model, X_train)
     threshold = train_errors.mean() + k * train_errors.std()
     print(f"Anomaly threshold (k={k}): {threshold:.4f}")
 
-    val_errors = compute_errors(model, X_val)
+    with stage("compute_errors (val)"):
+        val_errors = compute_errors(model, X_val)
     anomaly_indices = np.where(val_errors > threshold)[0]
 
     print(f"Anomalies in validation set: {len(anomaly_indices)} / {len(X_val)}")
     for idx in anomaly_indices[:20]:
         print(f"  Index {idx:4d} — error={val_errors[idx]:.4f}")
 
-    np.save(PROCESSED_DIR / "val_errors.npy", val_errors)
-    np.save(PROCESSED_DIR / "anomaly_threshold.npy", np.array([threshold]))
+    save_array(PROCESSED_DIR / "val_errors.npy", val_errors)
+    save_array(PROCESSED_DIR / "anomaly_threshold.npy", np.array([threshold]))
     print("Saved val_errors.npy and anomaly_threshold.npy")
 
+    t_val = load_array(PROCESSED_DIR / "t_val.npy")
+    run_id = save_to_db(t_val, val_errors, threshold)
+    print(f"Stored run {run_id} ({len(val_errors)} windows) in {DB_PATH}")
+
     return anomaly_indices, threshold
 
 
@@ -62,5 +105,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--k", type=float, default=3.0,
                         help="Number of std deviations above mean to set threshold")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
     args = parser.parse_args()
+    if args.profile:
+        profiler.enable()
     detect(k=args.k)
+    profiler.report()
@@ -0,0 +1,82 @@
+"""
+Data paths and artifact loading shared by the ML scripts.
+
+Paths are resolved relative to this file (or DATA_DIR), so scripts work from
+any working directory. Loads are memoised on (path, mtime, size): a standalone
+script behaves as before, and stages run by pipeline.py in one process reuse
+arrays, scalers and models already in memory instead of reading them again.
+Cached arrays are read-only since they may be shared between stages.
+"""
+
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DATA_DIR      = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+RAW_DIR       = DATA_DIR / "raw"
+PROCESSED_DIR = DATA_DIR / "processed"
+MODELS_DIR    = DATA_DIR / "models"
+
+_cache: dict[str, tuple[tuple, object]] = {}
+_lock = threading.Lock()
+
+
+def _key(path: Path) -> tuple:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _remember(path: Path, value):
+    with _lock:
+        _cache[str(path)] = (_key(path), value)
+    return value
+
+
+def _cached(path, loader):
+    path = Path(path)
+    key = _key(path)
+    with _lock:
+        hit = _cache.get(str(path))
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    return _remember(path, loader(path))
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def load_array(path) -> np.ndarray:
+    return _cached(path, lambda p: _read_only(np.load(p)))
+
+
+def load_pickle(path):
+    def read(p):
+        with open(p, "rb") as f:
+            return pickle.load(f)
+    return _cached(path, read)
+
+
+def load_checkpoint(path):
+    from model import load_model
+    return _cached(path, lambda p: load_model(str(p)))
+
+
+def save_array(path, array: np.ndarray) -> None:
+    np.save(path, array)
+    _remember(Path(path), _read_only(np.array(array)))
+
+
+def save_pickle(path, obj) -> None:
+    with open(path, "wb") as f:
+        pickle.dump(obj, f)
+    _remember(Path(path), obj)
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
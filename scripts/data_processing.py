@@ -8,12 +8,11 @@ Expected CSV schema (from backend export or direct ESP32 logs):
 
 import pandas as pd
 import numpy as np
-from pathlib import Path
 from sklearn.preprocessing import MinMaxScaler
-import pickle
+import argparse
+from artifacts import RAW_DIR, PROCESSED_DIR, save_array, save_pickle
+from stage_profiler import profiler, stage
 
-RAW_DIR = Path("../data/raw")
-PROCESSED_DIR = Path("../data/processed")
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
 FEATURES = ["moisture", "temperature", "humidity", "light"]
@@ -56,23 +55,43 @@ def make_sequences(
     return np.array(X, dtype=np.float32), np.array(y, dtype=np.float32)
 
 
+def normalize(scaler: MinMaxScaler, values: np.ndarray) -> np.ndarray:
+    """Scale raw feature rows (..., len(FEATURES)) — transform() for plain arrays, no DataFrame needed."""
+    return np.asarray(values) * scaler.scale_ + scaler.min_
+
+
+def denormalize_target(scaler: MinMaxScaler, values: np.ndarray) -> np.ndarray:
+    """Map normalized target values back to % — inverse_transform without the dummy columns."""
+    idx = FEATURES.index(TARGET)
+    return (np.asarray(values) - scaler.min_[idx]) / scaler.scale_[idx]
+
+
 def process():
-    df = load_raw()
-    df = clean(df)
+    with stage("load_raw"):
+        df = load_raw()
+    with stage("clean"):
+        df = clean(df)
 
     scaler = MinMaxScaler()
     scaled = scaler.fit_transform(df[FEATURES])
 
-    X, y = make_sequences(scaled)
+    with stage("make_sequences"):
+        X, y = make_sequences(scaled)
     split = int(len(X) * TRAIN_SPLIT)
 
-    np.save(PROCESSED_DIR / "X_train.npy", X[:split])
-    np.save(PROCESSED_DIR / "y_train.npy", y[:split])
-    np.save(PROCESSED_DIR / "X_val.npy", X[split:])
-    np.save(PROCESSED_DIR / "y_val.npy", y[split:])
+    # Timestamp of the last hour in each window, so downstream results can be dated
+    window_end = df.index.values[SEQ_LEN - 1 : SEQ_LEN - 1 + len(X)].astype("datetime64[s]")
 
-    with open(PROCESSED_DIR / "scaler.pkl", "wb") as f:
-        pickle.dump(scaler, f)
+    save_array(PROCESSED_DIR / "X_train.npy", X[:split])
+    save_array(PROCESSED_DIR / "y_train.npy", y[:split])
+    save_array(PROCESSED_DIR / "X_val.npy", X[split:])
+    save_array(PROCESSED_DIR / "y_val.npy", y[split:])
+    save_array(PROCESSED_DIR / "t_train.npy", window_end[:split])
+    save_array(PROCESSED_DIR / "t_val.npy", window_end[split:])
+    # Full scaled hourly series for walk-forward backtests (evaluate.py --backtest)
+    save_array(PROCESSED_DIR / "series.npy", scaled.astype(np.float32))
+    save_array(PROCESSED_DIR / "t_series.npy", df.index.values.astype("datetime64[s]"))
+    save_pickle(PROCESSED_DIR / "scaler.pkl", scaler)
 
     print(f"Processed {len(df)} hourly readings -> {len(X)} sequences")
     print(f"Train: {split}  Val: {len(X) - split}")
@@ -80,4 +99,10 @@ def process():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable()
     process()
+    profiler.report()
@@ -1,46 +1,51 @@
 """
 Evaluate LSTM performance: MAE, RMSE, and prediction vs actual plots.
 
+The default run scores single-step predictions on the validation split.
+--backtest runs a walk-forward backtest instead. It forecasts the full horizon
+autoregressively, as predict.py does, from every hourly origin in [start, end].
+Origins are batched into one tensor per step and sharded across processes.
+Origins start at the validation split (t_val[0]) so the scores are out of
+sample; --include-train lets [start, end] reach into the training period.
+
 Usage:
-  python evaluate.py
+  python evaluate.py [--profile]
+  python evaluate.py --backtest [--start 2024-03-01] [--end 2024-06-01] [--horizon 24] [--workers 4]
+                     [--include-train]
 """
 
+import multiprocessing
+import os
+import threading
 import numpy as np
 import torch
-import pickle
+import argparse
 import matplotlib.pyplot as plt
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.metrics import mean_absolute_error, mean_squared_error
-from model import load_model
-from data_processing import FEATURES, TARGET
-
-PROCESSED_DIR = Path("../data/processed")
-MODELS_DIR    = Path("../data/models")
+from model import rollout
+from data_processing import FEATURES, TARGET, SEQ_LEN, denormalize_target
+from artifacts import PROCESSED_DIR, MODELS_DIR, load_array, load_pickle, load_checkpoint
+from stage_profiler import profiler, stage
 
+DRY_THRESHOLD = 30.0  # %
+BATCH_SIZE    = 4096  # origins per rollout tensor
 
-def evaluate():
-    model = load_model(str(MODELS_DIR / "best_model.pt"))
+_plot_lock = threading.Lock()  # pyplot state is global; pipeline.py may plot from two threads
 
-    X_val = np.load(PROCESSED_DIR / "X_val.npy")
-    y_val = np.load(PROCESSED_DIR / "y_val.npy")
 
-    with open(PROCESSED_DIR / "scaler.pkl", "rb") as f:
-        scaler = pickle.load(f)
+def evaluate(show: bool = True):
+    model = load_checkpoint(MODELS_DIR / "best_model.pt")
+    X_val = load_array(PROCESSED_DIR / "X_val.npy")
+    y_val = load_array(PROCESSED_DIR / "y_val.npy")
+    scaler = load_pickle(PROCESSED_DIR / "scaler.pkl")
 
     model.eval()
-    with torch.no_grad():
+    with stage("inference"), torch.no_grad():
         preds_norm = model(torch.tensor(X_val, dtype=torch.float32)).numpy()
 
-    # Denormalize
-    target_idx = FEATURES.index(TARGET)
-    n = len(preds_norm)
-    dummy_pred = np.zeros((n, len(FEATURES)))
-    dummy_true = np.zeros((n, len(FEATURES)))
-    dummy_pred[:, target_idx] = preds_norm
-    dummy_true[:, target_idx] = y_val
-
-    preds = scaler.inverse_transform(dummy_pred)[:, target_idx]
-    trues = scaler.inverse_transform(dummy_true)[:, target_idx]
+    preds = denormalize_target(scaler, preds_norm)
+    trues = denormalize_target(scaler, y_val)
 
     mae  = mean_absolute_error(trues, preds)
     rmse = mean_squared_error(trues, preds) ** 0.5
@@ -49,19 +54,177 @@ def evaluate():
     print(f"RMSE: {rmse:.2f}%")
 
     # Plot
+    with _plot_lock:
+        _plot_evaluation(trues, preds, mae, rmse, show)
+    print(f"Plot saved to {MODELS_DIR / 'evaluation.png'}")
+
+
+def _plot_evaluation(trues, preds, mae, rmse, show):
     plt.figure(figsize=(14, 4))
     plt.plot(trues[:200], label="Actual moisture", alpha=0.8)
     plt.plot(preds[:200], label="Predicted moisture", alpha=0.8)
-    plt.axhline(30, color="red", linestyle="--", label="Dry threshold (30%)")
+    plt.axhline(DRY_THRESHOLD, color="red", linestyle="--", label=f"Dry threshold ({DRY_THRESHOLD:.0f}%)")
     plt.xlabel("Time step (hours)")
     plt.ylabel("Soil moisture (%)")
     plt.title(f"LSTM Forecast  |  MAE={mae:.2f}%  RMSE={rmse:.2f}%")
     plt.legend()
     plt.tight_layout()
     plt.savefig(MODELS_DIR / "evaluation.png", dpi=150)
-    plt.show()
-    print(f"Plot saved to {MODELS_DIR / 'evaluation.png'}")
+    if show:
+        plt.show()
+    plt.close()
+
+
+# ── Walk-forward backtest ────────────────────────────────────────────────────
+
+_worker = {}  # per-process model and series, set once by _init_worker
+
+
+def _init_worker(checkpoint: str, series: np.ndarray, horizon: int, threads: int):
+    torch.set_num_threads(threads)  # one pool process per core, not one thread pool per process each
+    _worker.update(model=load_checkpoint(checkpoint), series=series, horizon=horizon)
+
+
+def _forecast_shard(origins: np.ndarray) -> np.ndarray:
+    """Normalized (len(origins), horizon) forecasts; origin o uses series[o : o + SEQ_LEN]."""
+    series, horizon = _worker["series"], _worker["horizon"]
+    # (T - SEQ_LEN + 1, n_features, SEQ_LEN) view over the series — no copy until indexed
+    windows = np.lib.stride_tricks.sliding_window_view(series, SEQ_LEN, axis=0)
+    out = np.empty((len(origins), horizon), dtype=np.float32)
+    for start in range(0, len(origins), BATCH_SIZE):
+        idx = origins[start:start + BATCH_SIZE]
+        x = torch.from_numpy(np.ascontiguousarray(windows[idx].transpose(0, 2, 1)))
+        out[start:start + len(idx)] = rollout(_worker["model"], x, horizon, FEATURES.index(TARGET)).numpy()
+    return out
+
+
+def _origins(times: np.ndarray, horizon: int, start, end) -> np.ndarray:
+    """Origins whose window and horizon fall on consecutive hours and whose last input hour is in range."""
+    span = SEQ_LEN + horizon
+    o = np.arange(len(times) - span + 1)
+    contiguous = times[o + span - 1] - times[o] == np.timedelta64(span - 1, "h")
+    window_end = times[o + SEQ_LEN - 1]
+    keep = contiguous
+    if start is not None:
+        keep &= window_end >= np.datetime64(start)
+    if end is not None:
+        keep &= window_end <= np.datetime64(end)
+    return o[keep]
+
+
+def _first_below(values: np.ndarray, threshold: float) -> np.ndarray:
+    """Vectorised dry_at_hours: first 1-based step below threshold per row, NaN if none."""
+    below = values < threshold
+    first = below.argmax(axis=1).astype(np.float64) + 1
+    first[~below.any(axis=1)] = np.nan
+    return first
+
+
+def backtest(start=None, end=None, horizon: int = 24, workers: int = 1, include_train: bool = False) -> dict:
+    series = load_array(PROCESSED_DIR / "series.npy")
+    times = load_array(PROCESSED_DIR / "t_series.npy")
+    scaler = load_pickle(PROCESSED_DIR / "scaler.pkl")
+    checkpoint = str(MODELS_DIR / "best_model.pt")
+
+    if not include_train:
+        # Windows ending before the first validation window were trained on
+        val_start = load_array(PROCESSED_DIR / "t_val.npy")[0]
+        if start is None or np.datetime64(start) < val_start:
+            start = val_start
+
+    origins = _origins(times, horizon, start, end)
+    if not len(origins):
+        raise ValueError("No origins with a full window and horizon in the requested range")
+
+    with stage("backtest forecast"):
+        if workers <= 1:
+            _init_worker(checkpoint, series, horizon, torch.get_num_threads())
+            preds_norm = _forecast_shard(origins)
+        else:
+            shards = np.array_split(origins, workers)
+            # Spawn, not fork: pipeline.py calls this from a worker thread while other stages
+            # run torch, and a forked child can inherit a lock held by one of those threads
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(checkpoint, series, horizon, 1), mp_context=multiprocessing.get_context("spawn"),
+            ) as pool:
+                preds_norm = np.concatenate(list(pool.map(_forecast_shard, shards)))
+
+    target_idx = FEATURES.index(TARGET)
+    steps = origins[:, None] + SEQ_LEN + np.arange(horizon)
+    preds = denormalize_target(scaler, preds_norm)
+    trues = denormalize_target(scaler, series[steps, target_idx])
+
+    err = preds - trues
+    mae = np.abs(err).mean(axis=0)
+    rmse = np.sqrt((err ** 2).mean(axis=0))
+
+    dry_pred = _first_below(preds, DRY_THRESHOLD)
+    dry_true = _first_below(trues, DRY_THRESHOLD)
+    pred_dry, true_dry = ~np.isnan(dry_pred), ~np.isnan(dry_true)
+    both = pred_dry & true_dry
+    tp, fp, fn = int(both.sum()), int((pred_dry & ~true_dry).sum()), int((~pred_dry & true_dry).sum())
+    hours_off = np.abs(dry_pred[both] - dry_true[both])
+
+    return {
+        "origins": len(origins),
+        "first_origin": times[origins[0] + SEQ_LEN - 1],
+        "last_origin": times[origins[-1] + SEQ_LEN - 1],
+        "mae": mae,
+        "rmse": rmse,
+        "dry_accuracy": float((pred_dry == true_dry).mean()),
+        "dry_precision": tp / (tp + fp) if tp + fp else float("nan"),
+        "dry_recall": tp / (tp + fn) if tp + fn else float("nan"),
+        "dry_mae_hours": float(hours_off.mean()) if tp else float("nan"),
+        "dry_within_1h": float((hours_off <= 1).mean()) if tp else float("nan"),
+    }
+
+
+def report_backtest(result: dict):
+    horizon = len(result["mae"])
+    print(f"Walk-forward backtest: {result['origins']} origins, "
+          f"{result['first_origin']} → {result['last_origin']}, {horizon}h horizon")
+    print(f"{'hour':>4}  {'MAE %':>7}  {'RMSE %':>7}")
+    for h in range(horizon):
+        print(f"{h + 1:>4}  {result['mae'][h]:>7.2f}  {result['rmse'][h]:>7.2f}")
+    print(f"Dry within {horizon}h — accuracy {result['dry_accuracy']:.1%}, "
+          f"precision {result['dry_precision']:.1%}, recall {result['dry_recall']:.1%}")
+    print(f"Dry time when both dry — MAE {result['dry_mae_hours']:.2f}h, "
+          f"within ±1h {result['dry_within_1h']:.1%}")
+
+    table = np.column_stack([np.arange(1, horizon + 1), result["mae"], result["rmse"]])
+    np.savetxt(MODELS_DIR / "backtest.csv", table, delimiter=",", fmt=["%d", "%.4f", "%.4f"],
+               header="hour,mae,rmse", comments="")
+
+    plt.figure(figsize=(8, 4))
+    hours = np.arange(1, horizon + 1)
+    plt.plot(hours, result["mae"], marker="o", label="MAE")
+    plt.plot(hours, result["rmse"], marker="o", label="RMSE")
+    plt.xlabel("Forecast hour")
+    plt.ylabel("Error (% moisture)")
+    plt.title(f"Walk-forward backtest  |  {result['origins']} origins")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(MODELS_DIR / "backtest.png", dpi=150)
+    plt.close()
+    print(f"Results saved to {MODELS_DIR / 'backtest.csv'} and {MODELS_DIR / 'backtest.png'}")
 
 
 if __name__ == "__main__":
-    evaluate()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backtest", action="store_true", help="Walk-forward multi-hour backtest")
+    parser.add_argument("--start", help="First origin (last input hour), e.g. 2024-03-01")
+    parser.add_argument("--end", help="Last origin (last input hour)")
+    parser.add_argument("--horizon", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--include-train", action="store_true",
+                        help="Allow origins in the training period (scores are then partly in-sample)")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable()
+    if args.backtest:
+        report_backtest(backtest(args.start, args.end, args.horizon, args.workers, args.include_train))
+    else:
+        evaluate()
+    profiler.report()
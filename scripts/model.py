@@ -4,6 +4,9 @@ LSTM model for soil moisture forecasting.
 Architecture: stacked LSTM encoder → FC head → scalar moisture prediction
 """
 
+import copy
+
+import numpy as np
 import torch
 import torch.nn as nn
 
@@ -40,6 +43,68 @@ class MoistureLSTM(nn.Module):
         return self.head(last).squeeze(-1)
 
 
+def rollout(model: nn.Module, windows: torch.Tensor, horizon: int, target_idx: int = 0) -> torch.Tensor:
+    """
+    Autoregressive multi-step forecast for a batch of normalized windows.
+
+    windows: (batch, seq_len, input_size) → returns (batch, horizon). Each step's
+    prediction replaces the target feature of the next row; other features
+    are carried forward from the last known row.
+    """
+    preds = []
+    with torch.no_grad():
+        for _ in range(horizon):
+            pred = model(windows)
+            preds.append(pred)
+            next_row = windows[:, -1, :].clone()
+            next_row[:, target_idx] = pred
+            windows = torch.cat([windows[:, 1:, :], next_row.unsqueeze(1)], dim=1)
+    return torch.stack(preds, dim=1)
+
+
+def mc_dropout(model: nn.Module) -> nn.Module:
+    """
+    A copy of the model with dropout left on, for Monte-Carlo sampling.
+
+    A copy rather than toggling train() in place, so point forecasts running
+    concurrently on the original model stay deterministic.
+    """
+    return copy.deepcopy(model).train()
+
+
+def mc_rollout(
+    mc_model: nn.Module, windows: torch.Tensor, horizon: int, samples: int, target_idx: int = 0,
+) -> torch.Tensor:
+    """
+    K stochastic forecasts per window in one batched rollout: (samples, batch, horizon).
+
+    Windows are tiled to a (samples * batch) batch, so each step is a single
+    forward pass regardless of K. mc_model must come from mc_dropout().
+    """
+    batch = windows.shape[0]
+    tiled = windows.repeat(samples, 1, 1)
+    return rollout(mc_model, tiled, horizon, target_idx).reshape(samples, batch, horizon)
+
+
+def forecast_bands(draws: np.ndarray, threshold_pct: float, quantiles=(10, 50, 90)) -> dict[str, np.ndarray]:
+    """
+    Percentile bands and P(dry by hour h) from MC draws in %: (samples, ..., horizon).
+
+    A draw counts as dry by hour h if it dipped below the threshold at any hour up to h.
+    """
+    bands = dict(zip((f"p{q}" for q in quantiles), np.percentile(draws, quantiles, axis=0)))
+    bands["p_dry"] = (np.minimum.accumulate(draws, axis=-1) < threshold_pct).mean(axis=0)
+    return bands
+
+
+def dry_at_hours(forecast: list[float], threshold_pct: float) -> float | None:
+    """First forecast hour (1-based) below the dry threshold, or None."""
+    for i, m in enumerate(forecast):
+        if m < threshold_pct:
+            return float(i + 1)
+    return None
+
+
 def load_model(checkpoint_path: str, device: str = "cpu") -> MoistureLSTM:
     model = MoistureLSTM()
     state = torch.load(checkpoint_path, map_location=device, weights_only=True)
@@ -0,0 +1,258 @@
+"""
+Incremental runner for the ML workflow: process → train → {evaluate, backtest, detect} → predict.
+
+Each stage declares the files it reads and writes. A stage is skipped when the
+content hash of its inputs, its source files and its parameters matches the
+last successful run and its outputs still exist. A stage whose upstream
+re-ran but produced identical files is skipped too. Stages whose
+dependencies are done run concurrently in threads. They share one process,
+so arrays, the scaler and the model loaded by one stage are reused by the
+next through artifacts.py.
+
+Usage:
+  python pipeline.py                      # run whatever is out of date
+  python pipeline.py detect predict       # just these (and anything they depend on)
+  python pipeline.py --dry-run            # show what would run
+  python pipeline.py --force train        # re-run train and everything after it
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import matplotlib
+matplotlib.use("Agg")  # stages plot from worker threads; never open windows here
+
+from artifacts import DATA_DIR, RAW_DIR, PROCESSED_DIR, MODELS_DIR
+from stage_profiler import profiler, stage
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STATE_PATH  = DATA_DIR / ".pipeline_state.json"
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], object]
+    inputs: list[Path]
+    outputs: list[Path]
+    code: list[str]                        # scripts whose changes invalidate the stage
+    params: dict = field(default_factory=dict)
+    deps: set[str] = field(default_factory=set)
+
+
+def _processed(*names: str) -> list[Path]:
+    return [PROCESSED_DIR / n for n in names]
+
+
+def build_stages(args) -> dict[str, Stage]:
+    # Imported lazily so `--dry-run` and fully up-to-date runs don't pay for torch
+    def process():
+        from data_processing import process
+        process()
+
+    def train():
+        from train import train
+        train(epochs=args.epochs, lr=args.lr, batch_size=args.batch)
+
+    def evaluate():
+        from evaluate import evaluate
+        evaluate(show=False)
+
+    def backtest():
+        from evaluate import backtest, report_backtest
+        report_backtest(backtest(horizon=args.horizon, workers=args.workers))
+
+    def detect():
+        from anomaly_detection import detect
+        detect(k=args.k)
+
+    def predict():
+        from predict import predict
+        predict(horizon=args.predict_horizon, post_to_backend=args.post, samples=args.samples)
+
+    model = MODELS_DIR / "best_model.pt"
+    stages = [
+        Stage("process", process, sorted(RAW_DIR.glob("*.csv")),
+              _processed("X_train.npy", "y_train.npy", "X_val.npy", "y_val.npy", "t_train.npy",
+                         "t_val.npy", "series.npy", "t_series.npy", "scaler.pkl"),
+              ["data_processing.py"]),
+        Stage("train", train, _processed("X_train.npy", "y_train.npy", "X_val.npy", "y_val.npy"),
+              [model], ["train.py", "model.py"],
+              {"epochs": args.epochs, "lr": args.lr, "batch": args.batch}),
+        Stage("evaluate", evaluate, _processed("X_val.npy", "y_val.npy", "scaler.pkl") + [model],
+              [MODELS_DIR / "evaluation.png"], ["evaluate.py", "model.py"]),
+        Stage("backtest", backtest, _processed("series.npy", "t_series.npy", "t_val.npy", "scaler.pkl") + [model],
+              [MODELS_DIR / "backtest.csv", MODELS_DIR / "backtest.png"], ["evaluate.py", "model.py"],
+              {"horizon": args.horizon}),
+        Stage("detect", detect, _processed("X_train.npy", "X_val.npy", "t_val.npy") + [model],
+              _processed("val_errors.npy", "anomaly_threshold.npy"), ["anomaly_detection.py", "model.py"],
+              {"k": args.k}),
+        Stage("predict", predict, _processed("X_val.npy", "scaler.pkl") + [model],
+              [], ["predict.py", "model.py"],
+              {"horizon": args.predict_horizon, "post": args.post, "samples": args.samples}),
+    ]
+    producers = {out: s.name for s in stages for out in s.outputs}
+    for s in stages:
+        s.deps = {producers[p] for p in s.inputs if p in producers}
+    return {s.name: s for s in stages}
+
+
+class FileHasher:
+    """sha256 of file contents, remembered by (mtime, size) so unchanged files aren't re-read."""
+
+    def __init__(self, known: dict, lock: threading.Lock):
+        self.known = known
+        self._lock = lock  # shared with whoever serialises `known`
+
+    def __call__(self, path: Path) -> str:
+        if not path.exists():
+            return "missing"
+        st = path.stat()
+        key = f"{st.st_mtime_ns}:{st.st_size}"
+        with self._lock:
+            hit = self.known.get(str(path))
+        if hit and hit["key"] == key:
+            return hit["sha"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with self._lock:
+            self.known[str(path)] = {"key": key, "sha": h.hexdigest()}
+        return h.hexdigest()
+
+
+def fingerprint(s: Stage, file_hash: FileHasher) -> str:
+    h = hashlib.sha256()
+    for path in s.inputs:
+        h.update(f"{path.relative_to(DATA_DIR)}={file_hash(path)}\n".encode())
+    for name in s.code:
+        h.update(f"{name}={file_hash(SCRIPTS_DIR / name)}\n".encode())
+    h.update(json.dumps(s.params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _select(stages: dict[str, Stage], targets: list[str]) -> set[str]:
+    """Targets plus everything upstream of them."""
+    selected, todo = set(), list(targets or stages)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(stages[name].deps)
+    return selected
+
+
+def _downstream(stages: dict[str, Stage], names: set[str]) -> set[str]:
+    out, changed = set(names), True
+    while changed:
+        changed = False
+        for s in stages.values():
+            if s.name not in out and s.deps & out:
+                out.add(s.name)
+                changed = True
+    return out
+
+
+def run(stages: dict[str, Stage], targets: list[str], force: set[str], jobs: int, dry_run: bool) -> bool:
+    state = json.loads(STATE_PATH.read_text()) if STATE_PATH.exists() else {"stages": {}, "files": {}}
+    state_lock = threading.Lock()
+    file_hash = FileHasher(state["files"], state_lock)
+
+    selected = _select(stages, targets)
+    forced = _downstream(stages, force) & selected
+    done: set[str] = set()
+    failed: set[str] = set()
+
+    def up_to_date(s: Stage, fp: str) -> bool:
+        last = state["stages"].get(s.name)
+        return (
+            s.name not in forced and last is not None and last["fingerprint"] == fp
+            and all(p.exists() for p in s.outputs)
+        )
+
+    def execute(s: Stage) -> str:
+        fp = fingerprint(s, file_hash)
+        if up_to_date(s, fp):
+            return "up to date"
+        if dry_run:
+            return "would run"
+        start = time.perf_counter()
+        with stage(f"pipeline: {s.name}"):
+            s.run()
+        with state_lock:
+            # The pre-run fingerprint: inputs that changed mid-run make the next run redo this stage
+            state["stages"][s.name] = {"fingerprint": fp, "finished": time.time()}
+            STATE_PATH.write_text(json.dumps(state, indent=1))
+        return f"ran in {time.perf_counter() - start:.1f}s"
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while True:
+            blocked = {n for n in selected - done - failed - set(running.values())
+                       if stages[n].deps & failed}
+            failed |= blocked
+            for name in blocked:
+                print(f"[{name}] skipped: upstream failed")
+            ready = [
+                n for n in sorted(selected - done - failed - set(running.values()))
+                if stages[n].deps <= done
+            ]
+            for name in ready:
+                running[pool.submit(execute, stages[name])] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    failed.add(name)
+                    print(f"[{name}] failed: {e!r}")
+                    continue
+                done.add(name)
+                # A dry run changes no files, so mark what a real run would redo downstream
+                if dry_run and outcome == "would run":
+                    forced |= _downstream(stages, {name}) & selected
+                print(f"[{name}] {outcome}")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="*", default=None, metavar="STAGE",
+                        help="Re-run these stages (all selected if none given) and everything after them")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would run without running it")
+    parser.add_argument("--jobs", type=int, default=3, help="Stages to run at once")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=float, default=3.0, help="Anomaly threshold in std deviations")
+    parser.add_argument("--horizon", type=int, default=24, help="Backtest horizon (hours)")
+    parser.add_argument("--workers", type=int, default=1, help="Backtest processes")
+    parser.add_argument("--predict-horizon", type=int, default=6)
+    parser.add_argument("--samples", type=int, default=50, help="MC dropout samples for forecast bands")
+    parser.add_argument("--post", action="store_true", help="Post the forecast to the backend")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
+    args = parser.parse_args()
+
+    stages = build_stages(args)
+    unknown = (set(args.targets) | set(args.force or ())) - stages.keys()
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))} (choose from {', '.join(stages)})")
+    force = set(stages) if args.force == [] else set(args.force or ())
+
+    if args.profile:
+        profiler.enable()
+    ok = run(stages, args.targets, force, args.jobs, args.dry_run)
+    profiler.report()
+    raise SystemExit(0 if ok else 1)
@@ -2,82 +2,120 @@
 Run the trained LSTM to forecast future moisture and POST result to backend.
 
 Usage:
-  python predict.py [--horizon 6] [--post]
+  python predict.py [--horizon 6] [--samples 50] [--device-id ID [--registry]] [--post] [--profile]
+
+--samples K adds Monte-Carlo dropout bands (p10/p50/p90) and P(dry) per hour,
+from K stochastic rollouts run as one batch. --registry forecasts with the
+model promoted for --device-id (see registry.py) instead of best_model.pt.
+
+Without --device-id the input is the last window of the processed data. With
+one, it is that device's last SEQ_LEN hours, fetched from the backend's CSV
+export and cleaned like training data, so a posted forecast is built from the
+device it is stored under.
 """
 
 import argparse
+import io
 import numpy as np
+import pandas as pd
 import torch
-import pickle
-import json
+import os
 import requests
-from pathlib import Path
-from model import load_model
-from data_processing import FEATURES, TARGET, SEQ_LEN
-
-PROCESSED_DIR = Path("../data/processed")
-MODELS_DIR    = Path("../data/models")
-BACKEND_URL   = "http://localhost:8000"
+from datetime import datetime, timedelta, timezone
+from model import rollout, mc_dropout, mc_rollout, forecast_bands, dry_at_hours
+from data_processing import FEATURES, TARGET, SEQ_LEN, clean, normalize, denormalize_target
+from artifacts import PROCESSED_DIR, MODELS_DIR, load_array, load_pickle, load_checkpoint
+from registry import model_paths
+from stage_profiler import profiler, stage
+
+BACKEND_URL   = os.getenv("BACKEND_URL", "http://localhost:8000")
 DRY_THRESHOLD = 0.30  # normalized — corresponds to 30% moisture
 
 
 def get_latest_window() -> np.ndarray:
     """Load the most recent SEQ_LEN rows from processed data as model input."""
-    X_val = np.load(PROCESSED_DIR / "X_val.npy")
+    X_val = load_array(PROCESSED_DIR / "X_val.npy")
     return X_val[-1]  # shape: (SEQ_LEN, n_features)
 
 
-def predict(horizon: int = 6, post_to_backend: bool = False):
-    model = load_model(str(MODELS_DIR / "best_model.pt"))
-
-    with open(PROCESSED_DIR / "scaler.pkl", "rb") as f:
-        scaler = pickle.load(f)
-
-    window = get_latest_window()  # (SEQ_LEN, n_features)
-    forecast = []
-
-    for _ in range(horizon):
+def get_device_window(device_id: str, scaler) -> np.ndarray:
+    """The device's most recent SEQ_LEN hours from the backend, cleaned and normalized like training data."""
+    # Twice the window, so interpolation has neighbours and a quiet hour or two still leaves enough rows
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=2 * SEQ_LEN)
+    resp = requests.get(f"{BACKEND_URL}/readings/export",
+                        params={"device_id": device_id, "since": since.isoformat()}, timeout=30)
+    resp.raise_for_status()
+    df = pd.read_csv(io.StringIO(resp.text))
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df = df.set_index("timestamp")
+    df["light"] = df["light"].fillna(0.0)  # no light sensor, as the backend scheduler treats it
+    hourly = clean(df[FEATURES]) if len(df) else df
+    if len(hourly) < SEQ_LEN:
+        raise SystemExit(f"{device_id}: only {len(hourly)} usable hours in the last {2 * SEQ_LEN}h "
+                         f"(need {SEQ_LEN})")
+    return normalize(scaler, hourly.to_numpy()[-SEQ_LEN:]).astype(np.float32)
+
+
+def predict(horizon: int = 6, post_to_backend: bool = False, samples: int = 50, device_id: str = "default",
+            from_registry: bool = False):
+    if from_registry:
+        model_path, scaler_path = model_paths(device_id)
+    else:
+        model_path, scaler_path = MODELS_DIR / "best_model.pt", PROCESSED_DIR / "scaler.pkl"
+    model = load_checkpoint(model_path)
+    scaler = load_pickle(scaler_path)
+
+    if device_id == "default":
+        window = get_latest_window()  # (SEQ_LEN, n_features)
+    else:
+        with stage("fetch window"):
+            window = get_device_window(device_id, scaler)
+
+    with stage("predict loop"):
         x = torch.tensor(window[np.newaxis], dtype=torch.float32)  # (1, SEQ_LEN, n_features)
-        with torch.no_grad():
-            pred_normalized = model(x).item()
-
-        # Denormalize moisture only
-        target_idx = FEATURES.index(TARGET)
-        dummy = np.zeros((1, len(FEATURES)))
-        dummy[0, target_idx] = pred_normalized
-        moisture_pct = scaler.inverse_transform(dummy)[0, target_idx]
-        forecast.append(round(float(moisture_pct), 2))
-
-        # Roll window forward: append predicted step
-        new_row = window[-1].copy()
-        new_row[target_idx] = pred_normalized
-        window = np.vstack([window[1:], new_row])
-
-    predicted_dry_at = None
-    for i, m in enumerate(forecast):
-        if m < DRY_THRESHOLD * 100:
-            predicted_dry_at = float(i + 1)
-            break
+        preds_normalized = rollout(model, x, horizon, FEATURES.index(TARGET))[0].numpy()
+
+    forecast = [round(float(m), 2) for m in denormalize_target(scaler, preds_normalized)]
+    predicted_dry_at = dry_at_hours(forecast, DRY_THRESHOLD * 100)
 
     print(f"Forecast ({horizon}h): {forecast}")
     print(f"Predicted dry at: {predicted_dry_at} hours" if predicted_dry_at else "Plant stays OK within forecast window")
 
+    bands = None
+    if samples:
+        with stage("mc dropout"):
+            draws = mc_rollout(mc_dropout(model), x, horizon, samples, FEATURES.index(TARGET))[:, 0].numpy()
+        spread = forecast_bands(denormalize_target(scaler, draws), DRY_THRESHOLD * 100)
+        bands = {"samples": samples, **{k: np.round(v, 3 if k == "p_dry" else 2).tolist() for k, v in spread.items()}}
+        print(f"p10/p90 ({samples} samples): {bands['p10']} / {bands['p90']}")
+        print(f"P(dry) by hour: {bands['p_dry']}")
+
     if post_to_backend:
         payload = {
+            "device_id": device_id,
             "forecast": forecast,
             "horizon_hours": horizon,
-            "dry_threshold": DRY_THRESHOLD * 100,
             "predicted_dry_at_hours": predicted_dry_at,
+            "bands": bands,
         }
-        # Store via internal DB endpoint (direct insert — extend backend if needed)
-        print(f"[POST] Would send to {BACKEND_URL}/predictions (extend backend to accept this)")
+        resp = requests.post(f"{BACKEND_URL}/predictions", json=payload, timeout=10)
+        resp.raise_for_status()
+        print(f"[POST] Stored forecast for {device_id} at {BACKEND_URL}/predictions")
 
-    return forecast, predicted_dry_at
+    return forecast, predicted_dry_at, bands
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--horizon", type=int, default=6)
+    parser.add_argument("--samples", type=int, default=50, help="MC dropout samples for bands (0 = point only)")
+    parser.add_argument("--device-id", default="default", help="Forecast from this device's readings")
+    parser.add_argument("--registry", action="store_true", help="Use the model promoted for --device-id")
     parser.add_argument("--post", action="store_true", help="Post forecast to backend")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
     args = parser.parse_args()
-    predict(horizon=args.horizon, post_to_backend=args.post)
+    if args.profile:
+        profiler.enable()
+    predict(horizon=args.horizon, post_to_backend=args.post, samples=args.samples, device_id=args.device_id,
+            from_registry=args.registry)
+    profiler.report()
@@ -0,0 +1,188 @@
+"""
+Versioned model registry: checkpoints plus scalers keyed by device or plant type.
+
+data/models/manifest.json:
+
+  {
+    "revision": 12,                                  # bumped on every change
+    "models": {
+      "default":       {"promoted": 3, "versions": {"3": {"checkpoint": "registry/default/v3/model.pt",
+                                                          "scaler": "registry/default/v3/scaler.pkl", ...}}},
+      "species:basil": {...},
+      "device:esp-kitchen": {...}
+    },
+    "devices": {"esp-balcony": "species:basil"}      # device -> plant type key
+  }
+
+A device is served by "device:<id>" if registered, else by the key it is
+assigned to, else by "default". Only promoted versions are served. The backend
+polls the manifest and hot-swaps on promotion. Writes go to a temp file and are
+renamed into place, so readers never see a partial manifest. Every change holds
+an exclusive lock on manifest.json.lock from read to rename, so concurrent
+registrations (e.g. parallel train.py runs) neither lose entries nor share a
+version number.
+
+Usage:
+  python registry.py list
+  python registry.py register KEY CHECKPOINT SCALER [--promote]
+  python registry.py promote KEY VERSION
+  python registry.py assign DEVICE_ID KEY
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single writer assumed
+    fcntl = None
+
+from artifacts import MODELS_DIR, PROCESSED_DIR
+
+MANIFEST_PATH = MODELS_DIR / "manifest.json"
+DEFAULT_KEY = "default"
+
+
+def read_manifest(path: Path = MANIFEST_PATH) -> dict:
+    if not Path(path).exists():
+        return {"revision": 0, "models": {}, "devices": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _locked(path: Path = MANIFEST_PATH):
+    """Hold the manifest's write lock; take it around the whole read-modify-write."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_manifest(manifest: dict, path: Path = MANIFEST_PATH) -> None:
+    """Replace the manifest atomically; call with _locked(path) held."""
+    manifest["revision"] = manifest.get("revision", 0) + 1
+    fd, tmp = tempfile.mkstemp(dir=Path(path).parent, prefix=f"{Path(path).name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def resolve(manifest: dict, device_id: str) -> tuple[str, dict] | None:
+    """(key, promoted version entry) serving this device, or None."""
+    models = manifest.get("models", {})
+    for key in (f"device:{device_id}", manifest.get("devices", {}).get(device_id), DEFAULT_KEY):
+        entry = models.get(key) if key else None
+        if entry and entry.get("promoted") is not None:
+            return key, {"version": entry["promoted"], **entry["versions"][str(entry["promoted"])]}
+    return None
+
+
+def model_paths(device_id: str = "default", path: Path = MANIFEST_PATH) -> tuple[Path, Path]:
+    """Checkpoint and scaler for a device; the unregistered training outputs if nothing is promoted."""
+    found = resolve(read_manifest(path), device_id)
+    if found is None:
+        return MODELS_DIR / "best_model.pt", PROCESSED_DIR / "scaler.pkl"
+    _, entry = found
+    return Path(path).parent / entry["checkpoint"], Path(path).parent / entry["scaler"]
+
+
+def register(key: str, checkpoint: Path, scaler: Path, metrics: dict | None = None,
+             path: Path = MANIFEST_PATH) -> int:
+    """Copy a checkpoint and scaler into the registry as the key's next version (not yet served)."""
+    with _locked(path):
+        manifest = read_manifest(path)
+        entry = manifest["models"].setdefault(key, {"promoted": None, "versions": {}})
+        version = max(map(int, entry["versions"]), default=0) + 1
+
+        rel = Path("registry") / re.sub(r"[^A-Za-z0-9_.-]", "_", key) / f"v{version}"
+        target = Path(path).parent / rel
+        target.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(checkpoint, target / "model.pt")
+        shutil.copy2(scaler, target / "scaler.pkl")
+
+        entry["versions"][str(version)] = {
+            "checkpoint": str(rel / "model.pt"),
+            "scaler": str(rel / "scaler.pkl"),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "metrics": metrics or {},
+        }
+        _write_manifest(manifest, path)
+    return version
+
+
+def promote(key: str, version: int, path: Path = MANIFEST_PATH) -> None:
+    with _locked(path):
+        manifest = read_manifest(path)
+        entry = manifest["models"].get(key)
+        if entry is None or str(version) not in entry["versions"]:
+            raise KeyError(f"{key} v{version} is not registered")
+        entry["promoted"] = version
+        _write_manifest(manifest, path)
+
+
+def assign(device_id: str, key: str, path: Path = MANIFEST_PATH) -> None:
+    with _locked(path):
+        manifest = read_manifest(path)
+        if key not in manifest["models"]:
+            raise KeyError(f"{key} is not registered")
+        manifest.setdefault("devices", {})[device_id] = key
+        _write_manifest(manifest, path)
+
+
+def _print(manifest: dict) -> None:
+    print(f"Manifest revision {manifest['revision']}")
+    for key, entry in sorted(manifest["models"].items()):
+        for v, info in sorted(entry["versions"].items(), key=lambda kv: int(kv[0])):
+            mark = "*" if entry["promoted"] == int(v) else " "
+            print(f"  {mark} {key:<24} v{v:<4} {info['created']}  {info.get('metrics', {})}")
+    for device, key in sorted(manifest.get("devices", {}).items()):
+        print(f"    {device} -> {key}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    p = sub.add_parser("register")
+    p.add_argument("key")
+    p.add_argument("checkpoint", type=Path)
+    p.add_argument("scaler", type=Path)
+    p.add_argument("--promote", action="store_true")
+    p = sub.add_parser("promote")
+    p.add_argument("key")
+    p.add_argument("version", type=int)
+    p = sub.add_parser("assign")
+    p.add_argument("device_id")
+    p.add_argument("key")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        _print(read_manifest())
+    elif args.command == "register":
+        version = register(args.key, args.checkpoint, args.scaler)
+        if args.promote:
+            promote(args.key, version)
+        print(f"Registered {args.key} v{version}{' (promoted)' if args.promote else ''}")
+    elif args.command == "promote":
+        promote(args.key, args.version)
+        print(f"Promoted {args.key} v{args.version}")
+    elif args.command == "assign":
+        assign(args.device_id, args.key)
+        print(f"{args.device_id} -> {args.key}")
@@ -0,0 +1,106 @@
+"""
+Stage timer + memory tracker shared by the ML scripts.
+
+Disabled by default so the hooks cost nothing; each script turns it on with
+`--profile` and prints a per-stage table at the end:
+
+  python train.py --profile
+
+Python peak memory is process-wide, so stages that overlap in time (pipeline.py
+runs independent ones concurrently) include each other's allocations. Before any
+stage resets the peak, the current one is banked into every stage still
+running, so a stage's peak is never lost to a reset by another.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+def _max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.records: list[dict] = []
+        self._local = threading.local()  # stages can run concurrently (pipeline.py); nest per thread
+        self._lock = threading.Lock()
+        self._started = 0
+        self._active: list[dict] = []  # running frames across all threads; guarded by _lock
+
+    @property
+    def _stack(self) -> list[dict]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def enable(self):
+        self.enabled = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            frame = {"name": name, "depth": len(self._stack), "order": self._started, "peak": 0}
+            self._started += 1
+            self._reset_peak()
+            self._active.append(frame)
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            with self._lock:
+                self._reset_peak()
+                self._active.remove(frame)
+            peak = frame["peak"]
+            self._stack.pop()
+            self.records.append({
+                "name": name,
+                "depth": frame["depth"],
+                "order": frame["order"],
+                "wall_s": wall,
+                "peak_mb": peak / 2**20,
+                "max_rss_mb": _max_rss_mb(),
+            })
+
+    def _reset_peak(self) -> None:
+        # The reset wipes what running stages (parents, other threads) peaked at so far — bank it first
+        _, peak = tracemalloc.get_traced_memory()
+        for frame in self._active:
+            frame["peak"] = max(frame["peak"], peak)
+        tracemalloc.reset_peak()
+
+    def report(self):
+        if not self.enabled or not self.records:
+            return
+        width = max(len(r["name"]) + 2 * r["depth"] for r in self.records)
+        width = max(width, len("Stage"))
+        print(f"\n{'Stage':<{width}}  {'Wall (s)':>10}  {'Py peak (MB)':>12}  {'Max RSS (MB)':>12}")
+        print("-" * (width + 40))
+        # Records are appended on exit — show them in start order so nesting reads naturally
+        for r in sorted(self.records, key=lambda r: r["order"]):
+            rss = f"{r['max_rss_mb']:12.1f}" if r["max_rss_mb"] is not None else f"{'n/a':>12}"
+            label = "  " * r["depth"] + r["name"]
+            print(f"{label:<{width}}  {r['wall_s']:10.3f}  {r['peak_mb']:12.1f}  {rss}")
+
+
+profiler = StageProfiler()
+stage = profiler.stage
@@ -2,7 +2,11 @@
 Train the MoistureLSTM on processed data.
 
 Usage:
-  python train.py [--epochs 50] [--lr 0.001] [--batch 32]
+  python train.py [--epochs 50] [--lr 0.001] [--batch 32] [--register KEY [--promote]] [--profile]
+
+--register KEY copies the best checkpoint and scaler into the model registry as
+the next version of KEY ("default", "species:basil", "device:<id>"); --promote
+also makes it the served version, which the backend picks up without a restart.
 """
 
 import argparse
@@ -10,19 +14,19 @@ import numpy as np
 import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader, TensorDataset
-from pathlib import Path
 from model import MoistureLSTM
+from artifacts import PROCESSED_DIR, MODELS_DIR, load_array
+from registry import register, promote
+from stage_profiler import profiler, stage
 
-PROCESSED_DIR = Path("../data/processed")
-MODELS_DIR = Path("../data/models")
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def load_data(device: torch.device):
-    X_train = torch.tensor(np.load(PROCESSED_DIR / "X_train.npy")).to(device)
-    y_train = torch.tensor(np.load(PROCESSED_DIR / "y_train.npy")).to(device)
-    X_val   = torch.tensor(np.load(PROCESSED_DIR / "X_val.npy")).to(device)
-    y_val   = torch.tensor(np.load(PROCESSED_DIR / "y_val.npy")).to(device)
+    X_train = torch.tensor(load_array(PROCESSED_DIR / "X_train.npy")).to(device)
+    y_train = torch.tensor(load_array(PROCESSED_DIR / "y_train.npy")).to(device)
+    X_val   = torch.tensor(load_array(PROCESSED_DIR / "X_val.npy")).to(device)
+    y_val   = torch.tensor(load_array(PROCESSED_DIR / "y_val.npy")).to(device)
     return (
         DataLoader(TensorDataset(X_train, y_train), batch_size=32, shuffle=True),
         DataLoader(TensorDataset(X_val, y_val),   batch_size=64),
@@ -33,7 +37,8 @@ def train(epochs: int = 50, lr: float = 1e-3, batch_size: int = 32):
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Training on {device}")
 
-    train_loader, val_loader = load_data(device)
+    with stage("load_data"):
+        train_loader, val_loader = load_data(device)
 
     model = MoistureLSTM().to(device)
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
@@ -43,25 +48,26 @@ def train(epochs: int = 50, lr: float = 1e-3, batch_size: int = 32):
     best_val_loss = float("inf")
 
     for epoch in range(1, epochs + 1):
-        model.train()
-        train_loss = 0.0
-        for X_batch, y_batch in train_loader:
-            optimizer.zero_grad()
-            pred = model(X_batch)
-            loss = criterion(pred, y_batch)
-            loss.backward()
-            nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            optimizer.step()
-            train_loss += loss.item() * len(X_batch)
-        train_loss /= len(train_loader.dataset)
-
-        model.eval()
-        val_loss = 0.0
-        with torch.no_grad():
-            for X_batch, y_batch in val_loader:
+        with stage(f"train epoch {epoch:03d}"):
+            model.train()
+            train_loss = 0.0
+            for X_batch, y_batch in train_loader:
+                optimizer.zero_grad()
                 pred = model(X_batch)
-                val_loss += criterion(pred, y_batch).item() * len(X_batch)
-        val_loss /= len(val_loader.dataset)
+                loss = criterion(pred, y_batch)
+                loss.backward()
+                nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                optimizer.step()
+                train_loss += loss.item() * len(X_batch)
+            train_loss /= len(train_loader.dataset)
+
+            model.eval()
+            val_loss = 0.0
+            with torch.no_grad():
+                for X_batch, y_batch in val_loader:
+                    pred = model(X_batch)
+                    val_loss += criterion(pred, y_batch).item() * len(X_batch)
+            val_loss /= len(val_loader.dataset)
 
         scheduler.step(val_loss)
 
@@ -73,6 +79,7 @@ def train(epochs: int = 50, lr: float = 1e-3, batch_size: int = 32):
             print(f"  -> Saved best model (val={val_loss:.5f})")
 
     print(f"\nTraining complete. Best val loss: {best_val_loss:.5f}")
+    return best_val_loss
 
 
 if __name__ == "__main__":
@@ -80,5 +87,17 @@ if __name__ == "__main__":
     parser.add_argument("--epochs", type=int, default=50)
     parser.add_argument("--lr", type=float, default=1e-3)
     parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--register", metavar="KEY", help="Add the best model to the registry under KEY")
+    parser.add_argument("--promote", action="store_true", help="Serve the registered version")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage wall time and peak memory")
     args = parser.parse_args()
-    train(epochs=args.epochs, lr=args.lr, batch_size=args.batch)
+    if args.profile:
+        profiler.enable()
+    best_val_loss = train(epochs=args.epochs, lr=args.lr, batch_size=args.batch)
+    if args.register:
+        version = register(args.register, MODELS_DIR / "best_model.pt", PROCESSED_DIR / "scaler.pkl",
+                           metrics={"val_loss": round(best_val_loss, 6)})
+        if args.promote:
+            promote(args.register, version)
+        print(f"Registered {args.register} v{version}{' (promoted)' if args.promote else ''}")
+    profiler.report()